@@ -0,0 +1,115 @@
+'''
+micro benchmarks for the hot paths of the editors, run with:
+
+    python benchmark.py [name ...]
+
+with no names every benchmark is run
+'''
+import sys, time
+
+def timeit(fn, repeat=3):
+    best = None
+    for i in range(repeat):
+        t = time.perf_counter()
+        fn()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+def clipboard_html(rows, cols=8):
+    ## roughly what LibreOffice Calc puts on the clipboard: some head, then one big table
+    o = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8"/><style>td { font-size:10pt }</style></head><body>',
+        '<p>pasted &amp; scanned</p>',
+        '<table cellspacing="0" border="0">',
+    ]
+    for y in range(rows):
+        o.append('<tr>')
+        for x in range(cols):
+            o.append('<td align="right" sdval="%s" sdnum="1033;">%s</td>' % (y*x, y*x))
+        o.append('</tr>')
+    o.append('</table><p>tail</p></body></html>')
+    return ''.join(o)
+
+def bench_paste():
+    import xml.dom.minidom
+    from wordprocessor import scan_tables
+    print('paste: clipboard html -> tables')
+    for rows in (1000, 10000, 50000):
+        html = clipboard_html(rows)
+        mb = len(html.encode('utf-8')) / 1e6
+        def scan():
+            tables = list(scan_tables(html))
+            assert len(tables[0][2]) == rows
+        def dom():
+            xml.dom.minidom.parseString(html).getElementsByTagName('table')
+        t_scan = timeit(scan)
+        t_dom = timeit(dom, repeat=1)
+        print('  %6d rows %6.1f MB  scanner %6.1f MB/s  minidom %6.1f MB/s' % (rows, mb, mb/t_scan, mb/t_dom))
+
+def thumbnail_rgba(size):
+    ## flat background with a shaded disc, bottom up like the thumbnails in a blend
+    rows = []
+    r2 = (size*0.4) ** 2
+    for y in range(size):
+        row = bytearray(b'\x30\x30\x30\xff' * size)
+        for x in range(size):
+            d = (x - size/2) ** 2 + (y - size/2) ** 2
+            if d < r2:
+                v = int(255 * (1 - d/r2))
+                row[x*4 : x*4+3] = bytes((v, v//2, 255-v))
+        rows.append(bytes(row))
+    return b''.join(rows)
+
+def write_png_before(buf, width, height):
+    ## write_png as it was: a bytes slice per row and zlib level 9
+    import struct, zlib
+    width_byte_4 = width * 4
+    raw_data = b''.join(
+        b'\x00' + buf[span:span + width_byte_4]
+        for span in range((height - 1) * width * 4, -1, - width_byte_4)
+    )
+    def png_pack(png_tag, data):
+        chunk_head = png_tag + data
+        return (struct.pack('!I', len(data)) + chunk_head + struct.pack('!I', 0xFFFFFFFF & zlib.crc32(chunk_head)))
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        png_pack(b'IHDR', struct.pack('!2I5B', width, height, 8, 6, 0, 0, 0)),
+        png_pack(b'IDAT', zlib.compress(raw_data, 9)),
+        png_pack(b'IEND', b''),
+    ])
+
+def bench_write_png():
+    import io, zlib
+    from blender_thumbnailer import write_png
+    print('write_png: blend thumbnail -> png (ms, kB)')
+    settings = [
+        ('before', lambda buf, n: write_png_before(buf, n, n)),
+        ('level 9', lambda buf, n: write_png(buf, n, n)),
+        ('level 6', lambda buf, n: write_png(buf, n, n, level=6)),
+        ('level 1', lambda buf, n: write_png(buf, n, n, level=1)),
+        ('rle', lambda buf, n: write_png(buf, n, n, strategy=zlib.Z_RLE)),
+        ('9 to file', lambda buf, n: write_png(buf, n, n, out=io.BytesIO())),
+    ]
+    for size in (128, 256, 512, 1024):
+        buf = thumbnail_rgba(size)
+        line = []
+        for name, fn in settings:
+            t = timeit(lambda: fn(buf, size))
+            png = fn(buf, size)
+            if png is None:
+                line.append('%s %.1f' % (name, t*1e3))
+            else:
+                line.append('%s %.1f/%d' % (name, t*1e3, len(png)//1024))
+        print('  %4d\u00b2  %s' % (size, '  '.join(line)))
+
+
+BENCHMARKS = {
+    'paste' : bench_paste,
+    'write_png' : bench_write_png,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
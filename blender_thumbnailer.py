@@ -31,6 +31,10 @@ with the following contents:
 TryExec=blender-thumbnailer.py
 Exec=blender-thumbnailer.py %u %o
 MimeType=application/x-blender;
+
+To fill a thumbnail cache for a whole asset library at once:
+
+blender-thumbnailer.py --batch <blend|dir|glob> ... [-o outdir] [-j jobs]
 """
 
 import struct
@@ -78,98 +82,621 @@ def open_wrapper_get():
         return open_local_url
 
 
-def blend_extract_thumb(path):
-    import os
-    open_wrapper = open_wrapper_get()
-
-    REND = b'REND'
-    TEST = b'TEST'
-
-    blendfile = open_wrapper(path, 'rb')
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
 
-    head = blendfile.read(12)
 
-    if head[0:2] == b'\x1f\x8b':  # gzip magic
-        import gzip
-        blendfile.close()
-        blendfile = gzip.GzipFile('', 'rb', 0, open_wrapper(path, 'rb'))
-        head = blendfile.read(12)
-
-    if not head.startswith(b'BLENDER'):
-        blendfile.close()
-        return None, 0, 0
-
-    is_64_bit = (head[7] == b'-'[0])
-
-    # true for PPC, false for X86
-    is_big_endian = (head[8] == b'V'[0])
-
-    # blender pre 2.5 had no thumbs
-    if head[9:11] <= b'24':
-        return None, 0, 0
-
-    sizeof_bhead = 24 if is_64_bit else 20
-    int_endian = '>i' if is_big_endian else '<i'
-    int_endian_pair = int_endian + 'i'
+def open_zstd(fileobj):
+    """ stream over all the frames of a zstd compressed blend (blender 3.0+),
+    with the optional zstandard module or python 3.14's compression.zstd,
+    None when neither is there
+    """
+    try:
+        import zstandard
+    except ImportError:
+        try:
+            from compression import zstd
+        except ImportError:
+            return None
+        return zstd.ZstdFile(fileobj)
+    return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+
+
+class BlendBlocks:
+    """ the block (BHead) records of a blend file, iterated as
+    (code, offset, length) with offset where the block data starts in the
+    uncompressed file. An uncompressed local file is memory mapped and
+    read() returns memoryviews into the map, release them before close().
+    gzip and zstd blends are decompressed as a stream only as far as the
+    iteration gets, and read() only works for the block the iterator is on.
+
+        with BlendBlocks(path) as blocks:
+            for code, offset, length in blocks:
+                ...
+
+    With whole=True a compressed blend is decompressed into memory up front
+    and then read like a mapped one. records() gives the full headers.
+
+    version is 0 when the file is not a blend (or is zstd compressed and no
+    zstd module is installed).
+    """
+    __slots__ = ("file", "stream", "map", "pos", "version",
+                 "is_64_bit", "is_big_endian", "header_size", "bhead")
+
+    def __init__(self, path, whole=False):
+        import mmap
+        # only URIs go through the wrapper (Gio where installed), a plain
+        # local path is opened directly so it can be memory mapped
+        if '://' in path:
+            self.file = open_wrapper_get()(path, 'rb')
+        else:
+            self.file = open(path, 'rb')
+        self.stream = self.file
+        self.map = None
+        self.pos = 0
+        self.version = 0
+
+        magic = self.file.read(4)
+        self.file.seek(0)
+        if magic[:2] == GZIP_MAGIC:
+            import gzip
+            self.stream = gzip.GzipFile('', 'rb', 0, self.file)
+        elif magic == ZSTD_MAGIC:
+            self.stream = open_zstd(self.file)
+        elif hasattr(self.file, 'fileno'):
+            try:
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):  # empty, or not a mappable file
+                pass
+        if self.stream is None:
+            return
+        if whole and self.map is None:
+            # sized reads, the Gio wrapper has no read() without a size
+            chunks = []
+            chunk = self.stream.read(1 << 20)
+            while chunk:
+                chunks.append(chunk)
+                chunk = self.stream.read(1 << 20)
+            self.map = b''.join(chunks)
+
+        head = bytes(self.read(0, 12))
+        if not head.startswith(b'BLENDER') or not (head[9:12].isdigit() or head[7:9] == b'17'):
+            return
+        if head[7:9] == b'17':
+            # blender 5.0+: "BLENDER17-01v0500", blocks with 64 bit lengths
+            head = head + bytes(self.read(12, 5))
+            self.header_size = 17
+            self.is_64_bit = True
+            self.is_big_endian = (head[12] == b'V'[0])
+            self.version = int(head[13:17])
+            # code, SDNAnr, old address, length, nr
+            self.bhead = struct.Struct('>4siQqq' if self.is_big_endian else '<4siQqq')
+        else:
+            self.header_size = 12
+            self.is_64_bit = (head[7] == b'-'[0])
+            # true for PPC, false for X86
+            self.is_big_endian = (head[8] == b'V'[0])
+            self.version = int(head[9:12])
+            # code, length, old address, SDNAnr, nr
+            self.bhead = struct.Struct(('>' if self.is_big_endian else '<') + ('4siQii' if self.is_64_bit else '4siIii'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.map is not None:
+            if not isinstance(self.map, bytes):
+                self.map.close()
+            self.map = None
+        if self.stream is not None and self.stream is not self.file:
+            self.stream.close()
+        self.file.close()
+
+    def read(self, offset, length):
+        if self.map is not None:
+            return memoryview(self.map)[offset:offset + length]
+        if offset > self.pos:
+            self.skip(offset - self.pos)
+        data = self.stream.read(length)
+        self.pos += len(data)
+        return data
+
+    def skip(self, length):
+        if self.stream is self.file:
+            self.file.seek(length, 1)
+            self.pos += length
+            return
+        # decompressing streams can only go forward by reading
+        while length > 0:
+            data = self.stream.read(min(length, 1 << 20))
+            if not data:
+                break
+            self.pos += len(data)
+            length -= len(data)
+
+    def __iter__(self):
+        for code, offset, length, sdna, address, count in self.records():
+            yield code, offset, length
+
+    def records(self):
+        """ (code, offset, length, sdna index, old address, count) of each block """
+        if not self.version:
+            return
+        bhead = self.bhead
+        legacy = (self.header_size == 12)
+        pos = self.header_size
+        while True:
+            if self.map is not None:
+                if pos + bhead.size > len(self.map):
+                    return
+                fields = bhead.unpack_from(self.map, pos)
+            else:
+                data = self.read(pos, bhead.size)
+                if len(data) < bhead.size:
+                    return
+                fields = bhead.unpack(data)
+            if legacy:
+                code, length, address, sdna, count = fields
+            else:
+                code, sdna, address, length, count = fields
+            offset = pos + bhead.size
+            yield code, offset, length, sdna, address, count
+            if code == b'ENDB':
+                return
+            pos = offset + length
 
-    while True:
-        bhead = blendfile.read(sizeof_bhead)
 
-        if len(bhead) < sizeof_bhead:
+def blend_extract_thumb(path):
+    with BlendBlocks(path) as blocks:
+        # blender pre 2.5 had no thumbs
+        if blocks.version < 250:
             return None, 0, 0
 
-        code = bhead[:4]
-        length = struct.unpack(int_endian, bhead[4:8])[0]  # 4 == sizeof(int)
+        int_endian_pair = '>ii' if blocks.is_big_endian else '<ii'
 
-        if code == REND:
-            blendfile.seek(length, os.SEEK_CUR)
+        # the thumbnail is the first block after the render info ones, so the
+        # (compressed) rest of the file is never read
+        for code, offset, length in blocks:
+            if code != b'REND':
+                break
         else:
-            break
-
-    if code != TEST:
-        return None, 0, 0
-
-    try:
-        x, y = struct.unpack(int_endian_pair, blendfile.read(8))  # 8 == sizeof(int) * 2
-    except struct.error:
-        return None, 0, 0
-
-    length -= 8  # sizeof(int) * 2
-
-    if length != x * y * 4:
-        return None, 0, 0
+            return None, 0, 0
 
-    image_buffer = blendfile.read(length)
+        if code != b'TEST' or length < 8:
+            return None, 0, 0
 
-    if len(image_buffer) != length:
-        return None, 0, 0
+        data = blocks.read(offset, length)
+        try:
+            x, y = struct.unpack_from(int_endian_pair, data)
+            length -= 8  # sizeof(int) * 2
+            if length != x * y * 4 or len(data) != length + 8:
+                return None, 0, 0
+            image_buffer = bytes(data[8:])
+        finally:
+            if isinstance(data, memoryview):
+                data.release()
 
     return image_buffer, x, y
 
 
-def write_png(buf, width, height):
+class SDNA:
+    """ the struct layouts a blend was written with, read from its DNA1
+    block. structs maps a struct name to its size and its fields, each
+    field to (offset, type, is pointer, element count). Offsets simply add
+    up, makesdna has blender pad its structs explicitly
+    """
+    __slots__ = ("structs", "index")
+
+    def __init__(self, buf, offset, pointer_size, endian):
+        import re
+
+        def strings(pos, count):
+            out = []
+            for i in range(count):
+                end = buf.find(b'\0', pos)
+                out.append(buf[pos:end].decode('latin-1'))
+                pos = end + 1
+            return out, (pos + 3) & ~3
+
+        def section(pos, tag):
+            if buf[pos:pos + 4] != tag:
+                raise ValueError("bad SDNA, expected %r at %d" % (tag, pos))
+            return struct.unpack_from(endian + 'i', buf, pos + 4)[0], pos + 8
+
+        if buf[offset:offset + 4] != b'SDNA':
+            raise ValueError("bad SDNA")
+        count, pos = section(offset + 4, b'NAME')
+        names, pos = strings(pos, count)
+        count, pos = section(pos, b'TYPE')
+        types, pos = strings(pos, count)
+        if buf[pos:pos + 4] != b'TLEN':
+            raise ValueError("bad SDNA, expected TLEN at %d" % pos)
+        sizes = struct.unpack_from(endian + '%dH' % len(types), buf, pos + 4)
+        pos = (pos + 4 + 2 * len(types) + 3) & ~3
+        count, pos = section(pos, b'STRC')
+
+        shorts = struct.Struct(endian + 'HH')
+        self.structs = {}
+        self.index = []
+        for i in range(count):
+            type_index, field_count = shorts.unpack_from(buf, pos)
+            pos += 4
+            fields = {}
+            field_offset = 0
+            for j in range(field_count):
+                field_type, field_name = shorts.unpack_from(buf, pos)
+                pos += 4
+                name = names[field_name]
+                # "*next", "**mat", "name[66]", "obmat[4][4]", "(*func)()"
+                is_pointer = name[0] in '*('
+                element_count = 1
+                for n in re.findall(r'\[(\d+)\]', name):
+                    element_count *= int(n)
+                size = pointer_size if is_pointer else sizes[field_type]
+                fields[re.search(r'\w+', name).group()] = (field_offset, types[field_type], is_pointer, element_count)
+                field_offset += size * element_count
+            self.structs[types[type_index]] = (sizes[type_index], fields)
+            self.index.append(types[type_index])
+
+
+class BlendData:
+    """ pure python reader for what dump_blend gets out of blender: the
+    objects, meshes, materials and collections of a blend and the selection
+    in its current scene, read from the blocks using the file's own SDNA.
+    Only the headers are walked up front, struct fields are read on demand.
+    Raises ValueError (or struct.error) on files it can not make sense of
+    """
+    # DNA_object_types.h, DNA_layer_types.h
+    OB_MESH = 1
+    OB_GPENCIL_LEGACY = 26
+    BASE_SELECTED = 1 << 0
+
+    FORMATS = {
+        'char': 'b', 'uchar': 'B', 'int8_t': 'b', 'uint8_t': 'B',
+        'short': 'h', 'ushort': 'H', 'int16_t': 'h', 'uint16_t': 'H',
+        'int': 'i', 'uint': 'I', 'int32_t': 'i', 'uint32_t': 'I',
+        'float': 'f', 'double': 'd', 'int64_t': 'q', 'uint64_t': 'Q',
+    }
+
+    def __init__(self, blocks):
+        if not blocks.version or blocks.map is None:
+            raise ValueError("not a blend, or not opened whole")
+        self.buf = blocks.map
+        self.endian = '>' if blocks.is_big_endian else '<'
+        self.pointer = 'Q' if blocks.is_64_bit else 'I'
+        self.addresses = {}
+        self.codes = {}
+        dna = None
+        for code, offset, length, sdna, address, count in blocks.records():
+            if code == b'DNA1':
+                dna = offset
+            elif code != b'ENDB':
+                self.addresses[address] = offset
+                self.codes.setdefault(code, []).append((offset, address))
+        if dna is None:
+            raise ValueError("no DNA1 block")
+        self.sdna = SDNA(self.buf, dna, 8 if blocks.is_64_bit else 4, self.endian)
+
+    def field(self, struct_name, path):
+        """ (offset, type, is pointer, count) of a dotted field path """
+        offset = 0
+        for name in path.split('.'):
+            field_offset, struct_name, is_pointer, count = self.sdna.structs[struct_name][1][name]
+            offset += field_offset
+        return offset, struct_name, is_pointer, count
+
+    def has(self, struct_name, name):
+        return name in self.sdna.structs[struct_name][1]
+
+    def get(self, offset, struct_name, path):
+        """ value of a field of the struct at offset: pointers as addresses,
+        char arrays as text, other arrays as tuples """
+        field_offset, type_name, is_pointer, count = self.field(struct_name, path)
+        offset += field_offset
+        if is_pointer:
+            values = struct.unpack_from(self.endian + '%d%s' % (count, self.pointer), self.buf, offset)
+        elif type_name == 'char' and count > 1:
+            text = self.buf[offset:offset + count]
+            end = text.find(b'\0')
+            return (text if end < 0 else text[:end]).decode('utf-8', 'replace')
+        else:
+            values = struct.unpack_from(self.endian + '%d%s' % (count, self.FORMATS[type_name]), self.buf, offset)
+        return values[0] if count == 1 else values
+
+    def items(self, offset, struct_name, path):
+        """ offsets of the elements of a ListBase field, each starts with next """
+        address = self.get(offset, struct_name, path + '.first')
+        seen = set()
+        while address and address in self.addresses and address not in seen:
+            seen.add(address)
+            item = self.addresses[address]
+            yield item
+            address = struct.unpack_from(self.endian + self.pointer, self.buf, item)[0]
+
+    def ids(self, code):
+        return self.codes.get(code.ljust(4, b'\0'), ())
+
+    def metadata(self):
+        """ the same dict dump_blend writes """
+        dump = {
+            'objects': {},
+            'meshes': {},
+            'greases': {},
+            'fonts': {},
+            'materials': {},
+            'collections': {},
+            'selected': [],
+            'active_object': None,
+        }
+        names = {}
+        for code, struct_name in ((b'OB', 'Object'), (b'ME', 'Mesh'), (b'MA', 'Material'),
+                                  (b'GR', 'Collection'), (b'GD', 'bGPdata')):
+            if struct_name in self.sdna.structs:
+                for offset, address in self.ids(code):
+                    names[address] = self.get(offset, struct_name, 'id.name')[2:]
+
+        materials = {}
+        for offset, address in self.ids(b'MA'):
+            color = [self.get(offset, 'Material', c) for c in 'rgba']
+            materials[address] = {'name': names[address], 'color': color}
+            dump['materials'][names[address]] = {'color': color}
+
+        scale = 'scale' if self.has('Object', 'scale') else 'size'
+        for offset, address in self.ids(b'OB'):
+            name = names[address]
+            parent = self.get(offset, 'Object', 'parent')
+            dump['objects'][name] = {
+                'pos': list(self.get(offset, 'Object', 'loc')),
+                'rot': list(self.get(offset, 'Object', 'rot')),
+                'scl': list(self.get(offset, 'Object', scale)),
+                'parent': names.get(parent),
+            }
+            ob_type = self.get(offset, 'Object', 'type')
+            data = self.get(offset, 'Object', 'data')
+            if ob_type == self.OB_MESH and data in self.addresses:
+                mesh = self.addresses[data]
+                info = {'data': names.get(data), 'materials': []}
+                totcol = self.get(mesh, 'Mesh', 'totcol')
+                array = self.get(mesh, 'Mesh', 'mat')
+                if totcol and array in self.addresses:
+                    for mat in struct.unpack_from(self.endian + '%d%s' % (totcol, self.pointer), self.buf, self.addresses[array]):
+                        if mat in materials:
+                            info['materials'].append(dict(materials[mat]))
+                dump['meshes'][name] = info
+            elif ob_type == self.OB_GPENCIL_LEGACY:
+                dump['greases'][name] = names.get(data)
+
+        if 'Collection' in self.sdna.structs:
+            for offset, address in self.ids(b'GR'):
+                dump['collections'][names[address]] = [
+                    names.get(self.get(item, 'CollectionObject', 'ob'))
+                    for item in self.items(offset, 'Collection', 'gobject')]
+
+        # selection of the first view layer of the current scene, as
+        # bpy.context has it in a background blender
+        glob = self.ids(b'GLOB')
+        scene = glob and self.get(glob[0][0], 'FileGlobal', 'curscene')
+        if scene in self.addresses and self.has('Scene', 'view_layers'):
+            for layer in self.items(self.addresses[scene], 'Scene', 'view_layers'):
+                active = self.get(layer, 'ViewLayer', 'basact')
+                for base in self.items(layer, 'ViewLayer', 'object_bases'):
+                    ob = names.get(self.get(base, 'Base', 'object'))
+                    if self.get(base, 'Base', 'flag') & self.BASE_SELECTED:
+                        dump['selected'].append(ob)
+                if active in self.addresses:
+                    dump['active_object'] = names.get(self.get(self.addresses[active], 'Base', 'object'))
+                break
+        return dump
+
+
+def blend_read_metadata(path):
+    """ dump_blend's dict for a blend without starting blender, None when it
+    can not be read this way (not a blend, zstd without a zstd module, or a
+    layout this reader does not know) """
+    with BlendBlocks(path, whole=True) as blocks:
+        try:
+            return BlendData(blocks).metadata()
+        except (ValueError, KeyError, IndexError, struct.error):
+            return None
+
+
+def iter_png(buf, width, height, level=9, strategy=None, idat_size=1 << 16):
+    """ PNG of a bottom up RGBA buffer (as stored in blend files), yielded
+    piece by piece: the rows are flipped a band at a time into one reused
+    buffer through a memoryview and fed to a zlib compressobj, with an IDAT
+    chunk yielded whenever idat_size bytes of compressed data are ready.
+    level is the zlib level, 9 as before; 6 is about a third quicker for a
+    few percent more bytes. strategy is one of the zlib.Z_* strategies, on
+    blend thumbnails Z_RLE is no quicker than level 6 and 5 to 20x larger
+    """
     import zlib
 
-    # reverse the vertical line order and add null bytes at the start
-    width_byte_4 = width * 4
-    raw_data = b"".join(b'\x00' + buf[span:span + width_byte_4] for span in range((height - 1) * width * 4, -1, - width_byte_4))
+    if strategy is None:
+        strategy = zlib.Z_DEFAULT_STRATEGY
 
     def png_pack(png_tag, data):
         chunk_head = png_tag + data
         return struct.pack("!I", len(data)) + chunk_head + struct.pack("!I", 0xFFFFFFFF & zlib.crc32(chunk_head))
 
-    return b"".join([
-        b'\x89PNG\r\n\x1a\n',
-        png_pack(b'IHDR', struct.pack("!2I5B", width, height, 8, 6, 0, 0, 0)),
-        png_pack(b'IDAT', zlib.compress(raw_data, 9)),
-        png_pack(b'IEND', b'')])
+    yield b'\x89PNG\r\n\x1a\n'
+    yield png_pack(b'IHDR', struct.pack("!2I5B", width, height, 8, 6, 0, 0, 0))
+
+    # each scanline is a null filter byte and the row, last row of buf first
+    src = memoryview(buf)
+    stride = width * 4
+    line = stride + 1
+    band_rows = max(1, idat_size // line)
+    band = bytearray(line * min(band_rows, height))
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, strategy)
+    pending = []
+    pending_size = 0
+    for first in range(0, height, band_rows):
+        rows = min(band_rows, height - first)
+        for i in range(rows):
+            span = (height - 1 - first - i) * stride
+            band[i * line + 1:(i + 1) * line] = src[span:span + stride]
+        data = compressor.compress(memoryview(band)[:rows * line])
+        if data:
+            pending.append(data)
+            pending_size += len(data)
+        if pending_size >= idat_size:
+            yield png_pack(b'IDAT', b"".join(pending))
+            pending = []
+            pending_size = 0
+    pending.append(compressor.flush())
+    yield png_pack(b'IDAT', b"".join(pending))
+    yield png_pack(b'IEND', b'')
+
+
+def write_png(buf, width, height, level=9, strategy=None, out=None):
+    """ encode a bottom up RGBA buffer as PNG, see iter_png for level and
+    strategy. Returns the PNG bytes, or with out (a binary file object)
+    streams it there and returns None
+    """
+    chunks = iter_png(buf, width, height, level, strategy)
+    if out is None:
+        return b"".join(chunks)
+    for chunk in chunks:
+        out.write(chunk)
+
+
+def find_blends(patterns):
+    """ (blend, relative name) for every blend in the given files,
+    directories (searched recursively) and glob patterns. A file or a
+    glob match is named relative to the directories before the first
+    wildcard, so matches in different folders stay apart
+    """
+    import os
+    import glob
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.blend'):
+                        path = os.path.join(root, name)
+                        yield path, os.path.relpath(path, pattern)
+            continue
+        root = []
+        for part in os.path.dirname(pattern).split(os.sep):
+            if any(c in part for c in '*?['):
+                break
+            root.append(part)
+        root = os.sep.join(root) or os.curdir
+        if os.path.isfile(pattern):
+            # taken as is, even if its name has wildcard characters
+            yield pattern, os.path.relpath(pattern, root)
+            continue
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if path.endswith('.blend') and os.path.isfile(path):
+                yield path, os.path.relpath(path, root)
+
+
+def thumbnail_task(task):
+    """ extract one thumbnail for batch(), runs in a pool process """
+    import os
+    import time
+
+    file_in, file_out, level = task
+    result = {"input": file_in, "output": file_out}
+    t = time.perf_counter()
+    try:
+        buf, width, height = blend_extract_thumb(file_in)
+        if buf:
+            os.makedirs(os.path.dirname(file_out) or '.', exist_ok=True)
+            # written aside and moved in place, a cache reader never sees half a png
+            tmp = file_out + '.%d.tmp' % os.getpid()
+            try:
+                with open(tmp, 'wb') as f:
+                    write_png(buf, width, height, level=level, out=f)
+                os.replace(tmp, file_out)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            result.update(status="ok", width=width, height=height)
+        else:
+            result["status"] = "no-thumbnail"
+    except Exception as ex:
+        result.update(status="failed", error="%s: %s" % (type(ex).__name__, ex))
+    result["seconds"] = time.perf_counter() - t
+    return result
+
+
+def batch(patterns, output_dir=None, jobs=None, level=9, force=False):
+    """ thumbnail every blend found by find_blends on a pool of processes,
+    each to <blend without .blend>.png next to it, or under output_dir at
+    the same relative path. Outputs newer than their blend are skipped
+    unless force. Returns the summary: one record per file and the totals
+    """
+    import os
+    import time
+    from multiprocessing import Pool
+
+    t = time.perf_counter()
+    files = []
+    tasks = []
+    for file_in, name in find_blends(patterns):
+        if output_dir is None:
+            file_out = file_in[:-len('.blend')] + '.png'
+        else:
+            file_out = os.path.join(output_dir, name[:-len('.blend')] + '.png')
+        try:
+            fresh = not force and os.path.getmtime(file_out) >= os.path.getmtime(file_in)
+        except OSError:
+            fresh = False
+        if fresh:
+            files.append({"input": file_in, "output": file_out, "status": "skipped", "seconds": 0.0})
+        else:
+            tasks.append((file_in, file_out, level))
+
+    if tasks:
+        with Pool(min(jobs or os.cpu_count() or 1, len(tasks))) as pool:
+            files += pool.imap_unordered(thumbnail_task, tasks, chunksize=max(1, len(tasks) // 64))
+
+    totals = {}
+    for result in files:
+        totals[result["status"]] = totals.get(result["status"], 0) + 1
+    totals["files"] = len(files)
+    totals["seconds"] = time.perf_counter() - t
+    return {"files": files, "totals": totals}
 
 
 def main():
     import sys
 
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        import json
+        import argparse
+
+        parser = argparse.ArgumentParser(
+            prog="blender-thumbnailer.py --batch",
+            description="extract the thumbnails of many blends in parallel, "
+                        "prints a json summary with a record per file")
+        parser.add_argument("paths", nargs='+', help="blend files, directories or glob patterns")
+        parser.add_argument("-o", "--output", help="write the pngs here instead of next to each blend")
+        parser.add_argument("-j", "--jobs", type=int, help="processes to use, all cores by default")
+        parser.add_argument("--level", type=int, default=9, help="png compression level, 0-9 (default 9, 6 is quicker)")
+        parser.add_argument("--force", action='store_true', help="also redo thumbnails that are up to date")
+        parser.add_argument("--summary", help="write the summary to this file instead of stdout")
+        args = parser.parse_args(sys.argv[2:])
+
+        summary = batch(args.paths, args.output, args.jobs, args.level, args.force)
+        if args.summary:
+            with open(args.summary, 'w') as f:
+                json.dump(summary, f, indent=1)
+        else:
+            json.dump(summary, sys.stdout, indent=1)
+            print()
+        sys.exit(1 if summary["totals"].get("failed") else 0)
+
     if len(sys.argv) < 3:
         print("Expected 2 arguments <input.blend> <output.png>")
+        print("or --batch <path|dir|glob> ... (see --batch --help)")
     else:
         file_in = sys.argv[-2]
 
@@ -178,7 +705,7 @@ def main():
         if buf:
             file_out = sys.argv[-1]
             f = open(file_out, "wb")
-            f.write(write_png(buf, width, height))
+            write_png(buf, width, height, out=f)
             f.close()
         else:
             print('failed to extract thumbnail')
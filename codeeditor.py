@@ -1,39 +1,36 @@
-import os, sys, json, subprocess, string
+import os, sys, json, string, re, time, hashlib, tempfile, shutil, weakref
+from collections import namedtuple, OrderedDict
+from array import array
 
-def dump_blend(out):
+def dump_head():
     import bpy
-    dump = {}
-    objects = {}
-    meshes = {}
-    greases = {}
-    fonts  = {}
-    materials = {}
-    collections = {}
-    selected = []
-    dump = {
-        'objects':objects,
-        'meshes':meshes,
-        'greases':greases,
-        'fonts':fonts,
-        'materials':materials,
-        'collections':collections,
+    head = {
+        'objects':{},
+        'meshes':{},
+        'greases':{},
+        'fonts':{},
+        'materials':{},
+        'collections':{},
         'selected':[],
         'active_object' : None,
     }
     if bpy.context.active_object:
-        dump['active_object']=bpy.context.active_object.name
+        head['active_object']=bpy.context.active_object.name
     if bpy.context.selected_objects:
         for ob in bpy.context.selected_objects:
-            dump['selected'].append(ob.name)
+            head['selected'].append(ob.name)
+    return head
 
+def iter_dump_items():
+    import bpy
     for col in bpy.data.collections:
-        collections[col.name] = [ob.name for ob in col.objects]
+        yield 'collections', col.name, [ob.name for ob in col.objects]
 
     for ob in bpy.data.objects:
         p = None
         if ob.parent:
             p = ob.parent.name
-        objects[ob.name] = {
+        yield 'objects', ob.name, {
             'pos':list(ob.location), 
             'rot':list(ob.rotation_euler), 
             'scl':list(ob.scale),
@@ -41,31 +38,168 @@ def dump_blend(out):
         }
         if ob.type=='MESH':
             info = {'data':ob.data.name, 'materials':[]}
-            meshes[ob.name] = info
             for mat in ob.data.materials:
-                info['materials'].append( {'name':mat.name, 'color':list(mat.diffuse_color)} )
+                if mat is not None:  ## an empty material slot
+                    info['materials'].append( {'name':mat.name, 'color':list(mat.diffuse_color)} )
+            yield 'meshes', ob.name, info
 
         elif ob.type=='GPENCIL':
-            greases[ob.name] = ob.data.name
+            yield 'greases', ob.name, ob.data.name
 
     for mat in bpy.data.materials:
         r,g,b,a = mat.diffuse_color
-        materials[mat.name] = {
+        yield 'materials', mat.name, {
             'color':[r,g,b,a],
         }
 
+def iter_dump_parts(head, items, chunk=256):
+    '''
+    the scene metadata as a head (selection and empty sections) followed by
+    parts of at most chunk entries, so a big scene can be shown while it is
+    still being read.  merge_dump puts them back together
+    '''
+    yield head
+    part = {}
+    count = 0
+    for section, name, value in items:
+        part.setdefault(section, {})[name] = value
+        count += 1
+        if count == chunk:
+            yield part
+            part = {}
+            count = 0
+    if part:
+        yield part
+
+def merge_dump(dump, part):
+    ## sections are merged, anything else replaced, so a part sent twice does no harm
+    for key, value in part.items():
+        if isinstance(value, dict):
+            dump.setdefault(key, {}).update(value)
+        else:
+            dump[key] = value
+    return dump
+
+def dump_blend(out):
+    dump = {}
+    for part in iter_dump_parts(dump_head(), iter_dump_items()):
+        merge_dump(dump, part)
     print('saving:', out)
     open(out,'wb').write(json.dumps(dump).encode('utf-8'))
 
-def render_blend(out):
+def render_blend(out, size=128, samples=4, engine=None):
+    '''
+    still of the first scene, size pixels square.  engine overrides the
+    scene's own, samples is the anti aliasing of whichever engine it ends up
+    '''
     import bpy
     scn = bpy.data.scenes[0]
-    scn.render.resolution_x = 128
-    scn.render.resolution_y = 128
-    scn.eevee.taa_render_samples = 4
+    if engine:
+        scn.render.engine = engine
+    scn.render.resolution_x = size
+    scn.render.resolution_y = size
+    scn.render.resolution_percentage = 100
+    if scn.render.engine == 'BLENDER_WORKBENCH':
+        ## workbench only takes these sample counts
+        if samples <= 1:
+            scn.display.render_aa = 'OFF'
+        else:
+            scn.display.render_aa = min(('5','8','11','16','32'), key=lambda n: abs(int(n)-samples))
+    elif scn.render.engine == 'CYCLES':
+        scn.cycles.samples = samples
+    else:
+        scn.eevee.taa_render_samples = samples
     scn.render.filepath = out
     bpy.ops.render.render(write_still=True)
 
+## replies from the worker start with this so they can be told apart from blender's own output
+WORKER_REPLY = '\x1eMEGASOLID '
+
+def load_blend(blend):
+    import bpy
+    if blend and (bpy.data.filepath != blend or bpy.data.is_dirty):
+        bpy.ops.wm.open_mainfile(filepath=blend)
+
+def exec_script(script):
+    import io, contextlib
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        exec(compile(script, '<user>', 'exec'), {'__name__':'__main__'})
+    return out.getvalue()
+
+def worker_load(req, send):
+    load_blend(req['blend'])
+
+def worker_dump(req, send):
+    load_blend(req['blend'])
+    for part in iter_dump_parts(dump_head(), iter_dump_items()):
+        send(part)
+
+def worker_render(req, send):
+    load_blend(req['blend'])
+    render_blend(req['out'], req.get('size', 128), req.get('samples', 4), req.get('engine'))
+
+def worker_exec(req, send):
+    load_blend(req.get('blend'))
+    return exec_script(req['script'])
+
+WORKER_OPS = {
+    'load'   : worker_load,
+    'dump'   : worker_dump,
+    'render' : worker_render,
+    'exec'   : worker_exec,
+}
+
+## same protocol without bpy, for trying the editor side (and ops) without blender installed
+def fake_dump(req, send):
+    head = {'objects':{}, 'meshes':{}, 'greases':{}, 'fonts':{}, 'materials':{}, 'collections':{},
+        'selected':[], 'active_object':None}
+    items = [('objects', 'Cube', {'pos':[0,0,0], 'rot':[0,0,0], 'scl':[1,1,1], 'parent':None})]
+    for part in iter_dump_parts(head, items):
+        send(part)
+
+def fake_render(req, send):
+    import blender_thumbnailer
+    size = req.get('size', 2)
+    open(req['out'],'wb').write(blender_thumbnailer.write_png(b'\x80\x80\x80\xff'*size*size, size, size))
+
+FAKE_WORKER_OPS = {
+    'load'   : lambda req, send: None,
+    'dump'   : fake_dump,
+    'render' : fake_render,
+    'exec'   : lambda req, send: exec_script(req['script']),
+}
+
+def serve_worker(ops):
+    '''
+    the long lived blender: one json request per line on stdin.  Its stdout
+    is kept for replies only, one WORKER_REPLY line each: any number of
+    {"id","part"} a request streams, then its {"id","ok"} reply.  Whatever
+    else gets printed, by blender itself too, is sent to stderr
+    '''
+    sys.stdout.flush()
+    replies = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    def send(msg):
+        replies.write(WORKER_REPLY + json.dumps(msg) + '\n')
+        replies.flush()
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        req = json.loads(line)
+        id = req['id']
+        try:
+            result = ops[req['op']](req, lambda part: send({'id':id, 'part':part}))
+            send({'id':id, 'ok':True, 'result':result})
+        except Exception as err:
+            send({'id':id, 'ok':False, 'error':'%s: %s' % (type(err).__name__, err)})
+
 for arg in sys.argv:
     if arg.startswith('--dump-blend='):
         dump_blend(arg.split('=')[-1])
@@ -73,6 +207,12 @@ for arg in sys.argv:
     elif arg.startswith('--render='):
         render_blend(arg.split('=')[-1])
         sys.exit()
+    elif arg == '--worker':
+        serve_worker(WORKER_OPS)
+        sys.exit()
+    elif arg == '--fake-worker':
+        serve_worker(FAKE_WORKER_OPS)
+        sys.exit()
 
 from wordprocessor import *
 import blender_thumbnailer as nailer
@@ -88,23 +228,926 @@ else:
     if os.path.isfile(os.path.expanduser('~/Downloads/blender-4.2.1-linux-x64/blender')):
         BLENDER = os.path.expanduser('~/Downloads/blender-4.2.1-linux-x64/blender')
 
+## command line of the background blender worker, `--fake-blender` swaps in one without bpy
+BLENDER_WORKER = [BLENDER, '--background', '--python', __file__, '--', '--worker']
+
+
+## typed token record yielded by MegasolidCodeEditor.tokenize, kind is one of:
+## object, space, newline, symbol, keyword, word
+Token = namedtuple('Token', 'kind text pos')
+TOKEN_SYMBOLS = '()[]{}:.-=+*&^%<>/|'
+
+def compile_tokenizer(objects, keywords):
+    '''
+    single pass scanner: every character falls into exactly one group, and
+    keywords are one precompiled alternation (longest first) that only
+    matches a whole word
+    '''
+    stop = re.escape(''.join(objects) + ' \t\n' + TOKEN_SYMBOLS)
+    if keywords:
+        kws = '|'.join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True))
+    else:
+        kws = '(?!)'
+    return re.compile(
+        '(?P<object>[%s])|(?P<space>[ \t]+)|(?P<newline>\n)|(?P<symbol>[%s])|(?P<keyword>(?:%s)(?![^%s]))|(?P<word>[^%s]+)' % (
+        re.escape(''.join(objects)), re.escape(TOKEN_SYMBOLS), kws, stop, stop)
+    )
+
+def compile_keywords(objects, keywords):
+    stop = re.escape(''.join(objects) + ' \t\n' + TOKEN_SYMBOLS)
+    kws = '|'.join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True))
+    return re.compile('(?<![^%s])(?:%s)(?![^%s])' % (stop, kws or '(?!)', stop))
+
+
+class SyntaxProfile(object):
+    '''
+    keyword table for one language, its scanner is only compiled the first
+    time the profile is activated and then cached on the profile
+    '''
+    def __init__(self, name, extensions, syntax, sniff=None):
+        self.name = name
+        self.extensions = extensions
+        self.syntax = syntax
+        self.sniff_re = re.compile(sniff, re.MULTILINE) if sniff else None
+        self.token_re = None
+        self.syntax_re = None
+
+    def compile(self, objects):
+        if self.token_re is None:
+            self.token_re = compile_tokenizer(objects, self.syntax)
+            self.syntax_re = compile_keywords(objects, self.syntax)
+        return self
+
+    def sniff(self, txt):
+        return self.sniff_re is not None and self.sniff_re.search(txt) is not None
+
+def merge_syntax(*tables):
+    syntax = {}
+    for tab in tables:
+        syntax.update(tab)
+    return syntax
+
+
+class BlockHighlighter(QSyntaxHighlighter):
+    '''
+    Incremental highlighter: Qt re-colors only the blocks an edit touched, and
+    the ones after them while their end state changes, in place on each block,
+    so the document is never rebuilt.  highlight_block(text, state) gives a
+    block's (start, length, format) ranges and the state it ends in, which is
+    kept in the block's userState so multi-line constructs carry over to the
+    next block.  on_dirty(start, end) is told of what was colored, from the
+    event loop.
+
+    When a viewport widget is given and the document has more than
+    viewport_blocks blocks, coloring all of it (a new document or syntax
+    profile) only marks it dirty: the blocks on screen are colored first, then
+    a margin around them, scrolling pulls newly visible blocks to the front,
+    and the rest is filled in by short background slices while the UI is idle.
+    Outside of an edit Qt relayouts each block it re-colors on its own, so
+    these passes go a block at a time against a deadline.
+    '''
+    VIEWPORT_MARGIN = 50
+    ## seconds the pass over the blocks on screen may take, the rest waits for the next one
+    VISIBLE_BUDGET = 0.05
+    ## seconds a background slice may take
+    BACKGROUND_BUDGET = 0.016
+    BACKGROUND_INTERVAL = 10
+    IDLE_DELAY = 0.25
+
+    def __init__(self, document, highlight_block, on_dirty=None, viewport=None, viewport_blocks=500):
+        super(BlockHighlighter, self).__init__(None)
+        self.highlight_block = highlight_block
+        self.on_dirty = on_dirty
+        self.viewport = viewport
+        self.viewport_blocks = viewport_blocks
+        self.enabled = True
+        self.doc = None
+        ## sorted, non-overlapping [start, end] positions still to color
+        self.dirty = []
+        ## blocks Qt asked for that were left dirty, in the positions of that time
+        self.deferred = []
+        ## [start, end] colored since on_dirty was last called
+        self.colored = None
+        ## (first, last) block numbers on screen, as of the last pass
+        self.visible = None
+        ## a pass of our own colors all it is asked to, until the deadline if it has one
+        self.in_pass = False
+        self.deadline = None
+        self.colored_end = 0
+        self.replaying = False
+        self.last_activity = 0
+        ## False once a background slice ran far over its budget, see process
+        self.background = True
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.process)
+        if viewport is not None:
+            viewport.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        self.set_document(document)
+
+    def set_document(self, document):
+        ## None lets go of the current one, e.g. before the editor deletes it
+        self.timer.stop()
+        if self.document() is not None:
+            self.document().contentsChange.disconnect(self.on_contents_change)
+        self.dirty = []
+        self.deferred = []
+        self.colored = None
+        self.visible = None
+        self.background = True
+        self.replaying = False
+        self.doc = document
+        if document is None or not self.enabled:
+            self.setDocument(None)
+            return
+        ## connected before QSyntaxHighlighter is, so an edit is seen before its blocks are colored
+        document.contentsChange.connect(self.on_contents_change)
+        if self.is_large():
+            ## Qt goes over every block of a new document, it leaves them for process
+            self.mark_dirty(0, document.characterCount())
+        self.setDocument(document)
+
+    def is_large(self):
+        return self.viewport is not None and self.doc is not None and self.doc.blockCount() > self.viewport_blocks
+
+    def rehighlight(self):
+        if self.document() is None:
+            return
+        if self.is_large():
+            self.mark_dirty(0, self.document().characterCount())
+        else:
+            super(BlockHighlighter, self).rehighlight()
+
+    def set_enabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        document = self.doc
+        self.set_document(document if enabled else None)
+        if not enabled and document is not None:
+            ## Qt drops the formats without a relayout
+            document.markContentsDirty(0, document.characterCount())
+
+    def on_contents_change(self, pos, removed, added):
+        ## runs before the edited blocks are colored: what was noted so far is still
+        ## in the positions before the edit, and is shifted by the size change
+        self.last_activity = time.time()
+        self.flush_deferred()
+        ## a QTextEdit taking a document on announces all of it as new, though neither
+        ## the text nor the colors Qt goes over again have changed
+        self.replaying = pos == 0 and removed == 0 and added == self.doc.characterCount()
+        if self.replaying:
+            return
+        delta = added - removed
+        for rng in self.dirty + ([self.colored] if self.colored else []):
+            if rng[1] > pos:
+                rng[1] = max(rng[1] + delta, pos)
+            if rng[0] > pos:
+                rng[0] = max(rng[0] + delta, pos)
+        ## Qt colors the edited text itself
+        self.take_dirty(pos, pos + added)
+        self.timer.start(0)
+
+    def on_scroll(self, value):
+        self.last_activity = time.time()
+        self.visible = None
+        if self.dirty:
+            self.timer.start(0)
+
+    def mark_dirty(self, start, end):
+        if self.doc is not None:
+            end = min(end, self.doc.characterCount())
+        self.add_dirty(start, end)
+        self.timer.start(0)
+
+    def add_dirty(self, start, end):
+        ## merge [start, end] into the dirty ranges, keeping them sorted and apart
+        dirty = sorted(self.dirty + [[start, end]])
+        self.dirty = [dirty[0]]
+        for start, end in dirty[1:]:
+            if start <= self.dirty[-1][1]:
+                self.dirty[-1][1] = max(self.dirty[-1][1], end)
+            else:
+                self.dirty.append([start, end])
+
+    def flush_deferred(self):
+        deferred, self.deferred = self.deferred, []
+        for start, end in deferred:
+            self.add_dirty(start, end)
+
+    def take_dirty(self, start, end):
+        ## remove [start, end] from the dirty ranges, returning the parts that overlapped it
+        taken = []
+        dirty = []
+        for a, b in self.dirty:
+            if b <= start or a >= end:
+                dirty.append([a, b])
+                continue
+            taken.append([max(a, start), min(b, end)])
+            if a < start:
+                dirty.append([a, start])
+            if b > end:
+                dirty.append([end, b])
+        self.dirty = dirty
+        return taken
+
+    def is_dirty(self, start, end):
+        for a, b in self.dirty:
+            if a < end and b > start:
+                return True
+        return False
+
+    def visible_blocks(self):
+        ## (first, last) block numbers on screen: the top one is looked up with
+        ## cursorForPosition, the rest are walked down to the bottom of the viewport
+        view = self.viewport
+        layout = view.document().documentLayout()
+        block = view.cursorForPosition(QPoint(0, 0)).block()
+        first = block.blockNumber()
+        bottom = view.verticalScrollBar().value() + view.viewport().height()
+        while block.next().isValid() and layout.blockBoundingRect(block).bottom() < bottom:
+            block = block.next()
+        return first, block.blockNumber()
+
+    def wants(self, block, start, end):
+        ## whether highlightBlock colors block now or leaves it dirty
+        if self.in_pass:
+            return (self.deadline is None or time.time() < self.deadline) and not self.is_dirty(start, end)
+        if self.is_dirty(start, end):
+            return False
+        if not self.is_large():
+            return True
+        ## an edit in a large document colors what is on screen, and what Qt goes
+        ## on to from there is left to the passes
+        if self.visible is None:
+            return False
+        first, last = self.visible
+        return first - self.VIEWPORT_MARGIN <= block.blockNumber() <= last + self.VIEWPORT_MARGIN
+
+    def highlightBlock(self, text):
+        block = self.currentBlock()
+        start = block.position()
+        end = start + block.length()
+        if not self.wants(block, start, end):
+            ## formats and state are left as they were, so Qt does not go on to the next block
+            for rng in block.layout().formats():
+                self.setFormat(rng.start, rng.length, rng.format)
+            if self.replaying:
+                return
+            if self.deferred and self.deferred[-1][1] == start:
+                self.deferred[-1][1] = end
+            else:
+                self.deferred.append([start, end])
+            if not self.timer.isActive():
+                self.timer.start(0)
+            return
+        formats, state = self.highlight_block(text, self.previousBlockState())
+        for pos, length, fmt in formats:
+            self.setFormat(pos, length, fmt)
+        self.setCurrentBlockState(state)
+        if self.colored is None:
+            self.colored = [start, end]
+        else:
+            self.colored = [min(self.colored[0], start), max(self.colored[1], end)]
+        self.colored_end = end
+
+    def highlight_range(self, start, end, deadline=None):
+        ## with a deadline, whatever is left of the range is put back as dirty
+        document = self.document()
+        block = document.findBlock(start)
+        self.in_pass = True
+        self.deadline = deadline
+        try:
+            while block.isValid() and block.position() < end:
+                if deadline is not None and time.time() > deadline:
+                    self.add_dirty(block.position(), end)
+                    break
+                self.colored_end = 0
+                self.rehighlightBlock(block)
+                ## Qt goes on past the block while its end state changes
+                block = document.findBlock(max(self.colored_end, block.position() + block.length()))
+        finally:
+            self.in_pass = False
+            self.deadline = None
+
+    def finish(self):
+        ## color everything still dirty now, e.g. in a document that is not laid out yet
+        self.flush_deferred()
+        ranges, self.dirty = self.dirty, []
+        for start, end in ranges:
+            self.highlight_range(start, end)
+        self.report()
+
+    def report(self):
+        if self.colored is not None:
+            start, end = self.colored
+            self.colored = None
+            if self.on_dirty:
+                self.on_dirty(start, end)
+
+    def process(self):
+        self.flush_deferred()
+        self.report()
+        if not self.dirty or self.document() is None:
+            return
+        if not self.is_large():
+            self.finish()
+            return
+
+        ## what is on screen goes first, then the margin around it
+        document = self.document()
+        self.visible = first, last = self.visible_blocks()
+        deadline = time.time() + self.VISIBLE_BUDGET
+        for first, last in ((first, last), (first - self.VIEWPORT_MARGIN, last + self.VIEWPORT_MARGIN)):
+            start = document.findBlockByNumber(max(first, 0))
+            last = document.findBlockByNumber(min(last, document.blockCount() - 1))
+            for start, end in self.take_dirty(start.position(), last.position() + last.length()):
+                self.highlight_range(start, end, deadline)
+        self.flush_deferred()
+        self.report()
+        if time.time() > deadline:
+            self.timer.start(0)
+            return
+
+        ## the background only runs once the user has stopped typing and scrolling,
+        ## in slices of at most BACKGROUND_BUDGET so a keystroke never waits long
+        idle = time.time() - self.last_activity
+        if self.dirty and self.background and idle >= self.IDLE_DELAY:
+            start, end = self.dirty.pop(0)
+            began = time.time()
+            self.highlight_range(start, end, began + self.BACKGROUND_BUDGET)
+            ## outside of an edit Qt lays out every block after a colored one again, where a
+            ## single block takes several slices the rest is only colored as it comes on screen
+            if time.time() - began > self.BACKGROUND_BUDGET * 4:
+                self.background = False
+            self.flush_deferred()
+            self.report()
+            idle = self.IDLE_DELAY
+        if self.dirty and self.background:
+            self.timer.start(max(self.BACKGROUND_INTERVAL, int((self.IDLE_DELAY - idle) * 1000)))
+
+
+class BlenderJob(QObject):
+    '''
+    one Blender run on a QProcess, so the Qt event loop keeps going while
+    Blender works.  finished is emitted with the job on a clean exit, failed
+    with the job and a reason otherwise, including when it is cancelled
+    '''
+    finished = Signal(object)
+    failed = Signal(object, str)
+
+    def __init__(self, cmd, queued=True):
+        super(BlenderJob, self).__init__()
+        self.cmd = cmd
+        self.queued = queued
+        self.cancelled = False
+        self.process = QProcess(self)
+        self.process.finished.connect(self.on_finished)
+        self.process.errorOccurred.connect(self.on_error)
+
+    def start(self):
+        print(self.cmd)
+        self.process.start(self.cmd[0], self.cmd[1:])
+
+    def cancel(self):
+        self.cancelled = True
+        if self.process.state() == QProcess.ProcessState.NotRunning:
+            self.failed.emit(self, 'cancelled')
+        else:
+            self.process.kill()
+
+    def on_finished(self, code, status):
+        if self.cancelled:
+            self.failed.emit(self, 'cancelled')
+        elif status == QProcess.ExitStatus.NormalExit and code == 0:
+            self.finished.emit(self)
+        else:
+            self.failed.emit(self, 'blender exited with code %s' % code)
+
+    def on_error(self, error):
+        if error == QProcess.ProcessError.FailedToStart:
+            self.failed.emit(self, self.process.errorString())
+
+
+class WorkerJob(QObject):
+    '''
+    one request to a BlenderWorker, queued and cancelled through BlenderJobs
+    like a BlenderJob.  Parts the op streams come in through progress, on
+    success the op's return value is in self.result.
+    out is the extension of the file the op writes, the worker that takes
+    the job picks a scratch path and sets self.out to it
+    '''
+    finished = Signal(object)
+    failed = Signal(object, str)
+    progress = Signal(object, object)
+    started = Signal(object)
+
+    def __init__(self, worker, op, queued=True, out=None, **args):
+        super(WorkerJob, self).__init__()
+        self.worker = worker
+        self.request = dict(args, op=op)
+        self.queued = queued
+        self.out_ext = out
+        self.out = None
+        self.result = None
+        ## resent this many times if the worker dies while on it
+        self.retries = 1
+        ## failed already, the worker's reply is thrown away, see BlenderWorker.abandon
+        self.abandoned = False
+
+    def start(self):
+        self.worker.submit(self)
+        self.started.emit(self)
+
+    def cancel(self):
+        if not self.worker.cancel(self):
+            self.failed.emit(self, 'cancelled')
+
+    def abandon(self):
+        ## like cancel, but a running request is left to finish instead of killing the worker
+        if not self.worker.abandon(self):
+            self.failed.emit(self, 'cancelled')
+
+
+class BlenderWorker(QObject):
+    '''
+    a background Blender kept running between jobs so only its first
+    request pays for Blender starting up.  Requests are json lines on its
+    stdin (see serve_worker) answered on its stdout, its own output goes
+    straight to our stderr.  A worker that crashes is started again and
+    whatever it had in flight is resent
+    '''
+    def __init__(self, cmd=None, scratch=None):
+        super(BlenderWorker, self).__init__()
+        self.cmd = cmd or BLENDER_WORKER
+        self.scratch = scratch or ScratchSpace()
+        self.process = None
+        self.pending = {}
+        self.next_id = 0
+        self.buffer = b''
+        self.killing = False
+
+    def ensure_started(self):
+        if self.process is not None:
+            return
+        print(self.cmd)
+        self.buffer = b''
+        self.process = proc = QProcess(self)
+        proc.setProcessChannelMode(QProcess.ProcessChannelMode.ForwardedErrorChannel)
+        proc.readyReadStandardOutput.connect(self.on_ready_read)
+        proc.finished.connect(self.on_exit)
+        proc.errorOccurred.connect(self.on_error)
+        proc.start(self.cmd[0], self.cmd[1:])
+
+    def submit(self, job):
+        self.ensure_started()
+        self.next_id += 1
+        self.pending[self.next_id] = job
+        req = dict(job.request, id=self.next_id)
+        if job.out_ext:
+            ## a job resent after a crash keeps its file
+            if job.out is None:
+                job.out = self.scratch.path(job.out_ext, job.request['op'])
+            req['out'] = job.out
+        self.process.write((json.dumps(req) + '\n').encode('utf-8'))
+
+    def cancel(self, job):
+        ## the worker can not be interrupted mid request, so it is killed and the rest resent
+        for id, j in list(self.pending.items()):
+            if j is job and not job.abandoned:
+                del self.pending[id]
+                job.failed.emit(job, 'cancelled')
+                self.restart()
+                return True
+        return False
+
+    def abandon(self, job):
+        ## the job fails now, but stays pending as the worker is busy with it until it
+        ## replies; the reply and the job's out file are thrown away then
+        for j in self.pending.values():
+            if j is job and not job.abandoned:
+                job.abandoned = True
+                job.failed.emit(job, 'abandoned')
+                return True
+        return False
+
+    def restart(self):
+        if self.process is not None:
+            self.killing = True
+            self.process.kill()
+
+    def stop(self):
+        if self.process is None:
+            return
+        proc, self.process = self.process, None
+        proc.closeWriteChannel()
+        if not proc.waitForFinished(1000):
+            proc.kill()
+            proc.waitForFinished(1000)
+
+    def on_ready_read(self):
+        ## like on_exit, output of a worker that was stopped or replaced is dropped
+        proc = self.sender()
+        if proc is not self.process:
+            return
+        self.buffer += proc.readAllStandardOutput().data()
+        *lines, self.buffer = self.buffer.split(b'\n')
+        for line in lines:
+            line = line.decode('utf-8', 'replace')
+            ## blender prints its banner (and addons may print more) before the
+            ## worker takes over stdout, that goes on to stderr like the rest of its output
+            if not line.startswith(WORKER_REPLY):
+                if line.strip():
+                    sys.stderr.write(line + '\n')
+                continue
+            reply = json.loads(line[len(WORKER_REPLY):])
+            if 'part' in reply:
+                job = self.pending.get(reply['id'])
+                if job is not None and not job.abandoned:
+                    job.progress.emit(job, reply['part'])
+                continue
+            job = self.pending.pop(reply['id'], None)
+            if job is None:
+                continue
+            if job.abandoned:
+                self.scratch.release(job.out)
+                continue
+            if reply['ok']:
+                job.result = reply['result']
+                job.finished.emit(job)
+            else:
+                job.failed.emit(job, reply['error'])
+
+    def on_exit(self, code, status):
+        ## a worker that was stopped, or already replaced, is no concern anymore
+        proc = self.sender()
+        if proc is not self.process:
+            return
+        self.process = None
+        killed, self.killing = self.killing, False
+        jobs = [self.pending[id] for id in sorted(self.pending)]
+        self.pending = {}
+        for job in jobs:
+            if job.abandoned:
+                self.scratch.release(job.out)
+            elif killed or job.retries:
+                if not killed:
+                    job.retries -= 1
+                self.submit(job)
+            else:
+                job.failed.emit(job, 'blender worker exited with code %s' % code)
+
+    def on_error(self, error):
+        proc = self.sender()
+        if proc is not self.process or error != QProcess.ProcessError.FailedToStart:
+            return
+        self.process = None
+        jobs = [job for job in self.pending.values() if not job.abandoned]
+        self.pending = {}
+        for job in jobs:
+            job.failed.emit(job, proc.errorString())
+
+
+class BlenderWorkerPool(QObject):
+    '''
+    up to size BlenderWorkers, one per core by default, handed jobs the same
+    way as a single worker: an idle running worker first, then a new one,
+    then whichever has the least to do
+    '''
+    def __init__(self, size=None, cmd=None, scratch=None):
+        super(BlenderWorkerPool, self).__init__()
+        self.size = size or os.cpu_count() or 1
+        self.cmd = cmd
+        self.scratch = scratch or ScratchSpace()
+        self.workers = []
+
+    def pick(self):
+        idle = [w for w in self.workers if not w.pending]
+        for w in idle:
+            if w.process is not None:
+                return w
+        if len(self.workers) < self.size:
+            w = BlenderWorker(self.cmd, scratch=self.scratch)
+            w.setParent(self)
+            self.workers.append(w)
+            return w
+        if idle:
+            return idle[0]
+        return min(self.workers, key=lambda w: len(w.pending))
+
+    def submit(self, job):
+        self.pick().submit(job)
+
+    def cancel(self, job):
+        for w in self.workers:
+            if w.cancel(job):
+                return True
+        return False
+
+    def abandon(self, job):
+        for w in self.workers:
+            if w.abandon(job):
+                return True
+        return False
+
+    def stop(self):
+        for w in self.workers:
+            w.stop()
+
+
+class BlenderJobs(QObject):
+    '''
+    queued jobs run max_running at a time (one per pool worker),
+    interactive ones like run_script start right away
+    '''
+    changed = Signal()
+
+    def __init__(self, max_running=None):
+        super(BlenderJobs, self).__init__()
+        self.max_running = max_running or os.cpu_count() or 1
+        self.queue = []
+        self.running = []
+
+    def submit(self, job):
+        job.finished.connect(self.on_done)
+        job.failed.connect(self.on_done)
+        if job.queued:
+            self.queue.append(job)
+        else:
+            self.running.append(job)
+            job.start()
+        self.run_next()
+        self.changed.emit()
+        return job
+
+    def run_next(self):
+        while self.queue and len([j for j in self.running if j.queued]) < self.max_running:
+            job = self.queue.pop(0)
+            self.running.append(job)
+            job.start()
+
+    def on_done(self, job, *args):
+        if job in self.running:
+            self.running.remove(job)
+        if job in self.queue:
+            self.queue.remove(job)
+        self.run_next()
+        self.changed.emit()
+
+    def cancel(self, job):
+        job.cancel()
+
+    def cancel_all(self):
+        for job in self.queue + self.running:
+            job.cancel()
+
+
+class ScratchSpace(object):
+    '''
+    private temp directory for one editor: each job gets its own file in it,
+    so parallel jobs and other editor instances never share one.  Files are
+    released when read back, and the directory goes with the editor
+    '''
+    def __init__(self, prefix='megasolid-'):
+        self.root = tempfile.mkdtemp(prefix=prefix)
+        self.count = 0
+        self.finalizer = weakref.finalize(self, shutil.rmtree, self.root, True)
+
+    def path(self, suffix='', name='job'):
+        self.count += 1
+        return os.path.join(self.root, '%s%s%s' % (name, self.count, suffix))
+
+    def owns(self, path):
+        return path.startswith(self.root + os.sep)
+
+    def release(self, path):
+        if path and self.owns(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def cleanup(self):
+        self.finalizer()
+
+
+class ImageCache(object):
+    '''
+    scaled copies of images keyed by source path, mtime and size, so an
+    unchanged image is only decoded and scaled once.  The scaling itself
+    is done off the GUI thread by the editor's ImageDecoder, the least
+    recently used go first past max_bytes
+    '''
+    def __init__(self, max_bytes=128 << 20):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.bytes = 0
+
+    def key(self, src, size):
+        try:
+            mtime = os.stat(src).st_mtime_ns
+        except OSError:
+            mtime = None
+        return (src, mtime, size)
+
+    def peek(self, src, size):
+        '''
+        src scaled to fit size x size, or None when it is not cached
+        '''
+        key = self.key(src, size)
+        q = self.images.get(key)
+        if q is not None:
+            self.images.move_to_end(key)
+        return q
+
+    def add(self, src, scaled):
+        for size in scaled:
+            self.put(self.key(src, size), scaled[size])
+
+    def put(self, key, q):
+        if key in self.images:
+            self.bytes -= self.images.pop(key).sizeInBytes()
+        self.images[key] = q
+        self.bytes += q.sizeInBytes()
+        while self.bytes > self.max_bytes and len(self.images) > 1:
+            key, old = self.images.popitem(last=False)
+            self.bytes -= old.sizeInBytes()
+
+
+def thumb_to_qimage(buf, width, height):
+    '''
+    QImage of a blend thumbnail straight from its RGBA rows, which blender
+    stores bottom up.  mirrored does the flip and makes the one copy, so the
+    image does not depend on buf afterwards
+    '''
+    q = QImage(buf, width, height, width*4, QImage.Format.Format_RGBA8888)
+    return q.mirrored(False, True)
+
+
+class BlendCache(object):
+    '''
+    persistent cache of parse_blend results: the dump_blend json and the
+    extracted thumbnail, as the raw RGBA blender stores it (THUMB_SIZE in
+    the json), are stored under a key made from the blend path,
+    mtime and size, so an edited blend is simply a miss.  Entries are
+    evicted least recently used first past max_entries, and hit/miss totals
+    are kept in stats.json (see `python codeeditor.py --blend-cache-stats`),
+    counted in memory and added to it on flush
+    '''
+    def __init__(self, root=None, max_entries=512):
+        if root is None:
+            root = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'megasolid', 'blend')
+        self.root = root
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.unflushed = {'hits':0, 'misses':0}
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, blend):
+        st = os.stat(blend)
+        k = '%s\0%s\0%s' % (os.path.abspath(blend), st.st_mtime_ns, st.st_size)
+        return hashlib.sha1(k.encode('utf-8')).hexdigest()
+
+    def get(self, blend):
+        try:
+            key = self.key(blend)
+            path = os.path.join(self.root, key + '.json')
+            info = json.loads(open(path, 'rb').read())
+            if 'THUMB' in info and ('THUMB_SIZE' not in info or not os.path.isfile(info['THUMB'])):
+                raise OSError('missing thumbnail: %s' % info['THUMB'])
+            os.utime(path)  ## mtime doubles as the last use for eviction
+        except (OSError, ValueError):
+            self.count(misses=1)
+            return None
+        self.count(hits=1)
+        return info
+
+    def put(self, blend, info, thumb=None):
+        ## thumb is the (buf, width, height) of blend_extract_thumb
+        key = self.key(blend)
+        if thumb:
+            buf, width, height = thumb
+            info['THUMB'] = os.path.join(self.root, key + '.thumb.rgba')
+            info['THUMB_SIZE'] = [width, height]
+            open(info['THUMB'], 'wb').write(buf)
+        path = os.path.join(self.root, key + '.json')
+        open(path + '.tmp', 'wb').write(json.dumps(info).encode('utf-8'))
+        os.replace(path + '.tmp', path)
+        self.evict()
+
+    def entries(self):
+        return [os.path.join(self.root, f) for f in os.listdir(self.root) if f.endswith('.json') and f != 'stats.json']
+
+    def evict(self):
+        entries = self.entries()
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            for p in (path, path[:-5] + '.thumb.rgba', path[:-5] + '.thumb.png'):
+                if os.path.isfile(p):
+                    os.remove(p)
+
+    def load_stats(self):
+        try:
+            return json.loads(open(os.path.join(self.root, 'stats.json'), 'rb').read())
+        except (OSError, ValueError):
+            return {'hits':0, 'misses':0}
+
+    def count(self, hits=0, misses=0):
+        self.hits += hits
+        self.misses += misses
+        self.unflushed['hits'] += hits
+        self.unflushed['misses'] += misses
+
+    def flush(self):
+        if not self.unflushed['hits'] and not self.unflushed['misses']:
+            return
+        totals = self.load_stats()
+        totals['hits'] += self.unflushed['hits']
+        totals['misses'] += self.unflushed['misses']
+        path = os.path.join(self.root, 'stats.json')
+        open(path + '.tmp', 'wb').write(json.dumps(totals).encode('utf-8'))
+        os.replace(path + '.tmp', path)
+        self.unflushed = {'hits':0, 'misses':0}
+
+    def stats(self):
+        totals = self.load_stats()
+        totals['hits'] += self.unflushed['hits']
+        totals['misses'] += self.unflushed['misses']
+        lookups = totals['hits'] + totals['misses']
+        entries = self.entries()
+        return {
+            'root' : self.root,
+            'entries' : len(entries),
+            'bytes' : sum(os.path.getsize(os.path.join(self.root, f)) for f in os.listdir(self.root)),
+            'session_hits' : self.hits,
+            'session_misses' : self.misses,
+            'hits' : totals['hits'],
+            'misses' : totals['misses'],
+            'hit_rate' : totals['hits'] / lookups if lookups else 0.0,
+        }
+
 
 class MegasolidCodeEditor( MegasolidEditor ):
+    ## documents with more blocks than this only highlight what is on screen first
+    VIEWPORT_HIGHLIGHT_BLOCKS = 500
+    ## the line number column stops here
+    MAX_LINE_COUNTS = 10000
+    ## seconds between side panel updates while a blend is still streaming in
+    BLEND_PANEL_INTERVAL = 0.5
+    ## inline thumbnails of dropped images are named this plus the image path
+    INLINE_IMAGE = 'thumb:'
+    INLINE_THUMB_SIZE = 32
+    INLINE_PREVIEW_SIZE = 256
+    ## blends without an embedded thumbnail get a render with these settings,
+    ## one that takes longer than PREVIEW_BUDGET seconds is given up on
+    PREVIEW_SIZE = 128
+    PREVIEW_SAMPLES = 1
+    PREVIEW_ENGINE = 'BLENDER_WORKBENCH'
+    PREVIEW_BUDGET = 10.0
+    ## ms of no edits before the tooltips of deleted tables are dropped
+    TOOLTIP_PRUNE_DELAY = 1000
+
     def reset(self, x=100, y=100, width=960, height=600, use_icons=False, use_menu=False, alt_widget=None):
         self.tables = []
+        self.tooltips = {}
+        ## the tooltips of deleted tables are dropped once editing pauses, see prune_tooltips
+        self.tooltip_timer = QTimer()
+        self.tooltip_timer.setSingleShot(True)
+        self.tooltip_timer.timeout.connect(self.prune_tooltips)
+        ## images in edited blocks are swapped for thumbnails once the edit is through,
+        ## (start, end) covers every block colored since, see on_dirty_blocks
+        self.images_range = None
+        self.images_timer = QTimer()
+        self.images_timer.setSingleShot(True)
+        self.images_timer.timeout.connect(self.on_images_timer)
         self.blender_symbols = list(self.BLEND_SYMS)
         self.blend_syms = {}
         self.blend_thumbs = {}
+        self.blend_images = {}
         self.blend_files = {}
+        self.blend_cache = BlendCache()
+        self.scratch = ScratchSpace()
+        self.blender_worker = BlenderWorkerPool(scratch=self.scratch)
+        self.blender_jobs = BlenderJobs(max_running=self.blender_worker.size)
+        self.blend_jobs = {}
+        self.preview_jobs = {}
+        self.side_blend = None
+        self.side_blend_time = 0
         layout = QVBoxLayout()
         container = QWidget()
         container.setLayout(layout)
         self.line_counts = QLabel('.')
-        layout.addWidget(self.line_counts)
-        layout.addStretch(1)
+        ## the numbers past the bottom are cut off rather than growing the window
+        self.line_counts.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Ignored)
+        self.line_counts.setAlignment(Qt.AlignmentFlag.AlignTop)
+        layout.addWidget(self.line_counts, stretch=1)
         self.left_widget = container
         self.images_layout = None
         self.qimages = {}
+        self.image_cache = ImageCache()
         self.blend_previews = {}
 
         layout = QVBoxLayout()
@@ -130,16 +1173,20 @@ class MegasolidCodeEditor( MegasolidEditor ):
         self.editor.on_link_clicked = self.on_link_clicked
         self.editor.on_new_table = self.on_new_table
         self.editor.on_mouse_over_anchor = self.on_mouse_over_anchor
+        self.editor.on_image_ready = self.on_image_ready
+        self.editor.image_decoder.sizes = (self.INLINE_THUMB_SIZE, self.INLINE_PREVIEW_SIZE)
         self.editor.extra_mime_types = {
             '.blend' : self.on_new_blend,
         }
         self.blends = []
 
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.loop)
-        self.timer.start(3000)
-        self.prev_html = None
+        self.auto_syntax = True
+        self.syntax_profile = self.SYNTAX_PROFILES['any'].compile(self.OBJ_SYMS)
         self.use_syntax_highlight = True
+        self.highlighter = self.new_highlighter(self.editor.document(), self.on_dirty_blocks)
+        self.loading_highlighter = None
+        self.editor.document().blockCountChanged.connect(self.update_line_counts)
+        self.update_line_counts()
         self.use_syntax_highlight_action = act = QAction("🗹", self)
         act.setToolTip("toggle syntax highlighting")
         act.setStatusTip("toggle syntax highlighting")
@@ -148,6 +1195,15 @@ class MegasolidCodeEditor( MegasolidEditor ):
         act.toggled.connect( lambda x,a=act: self.toggle_syntax_highlight(x,a) )
         self.format_toolbar.addAction(act)
 
+        ## item data is the profile name, the auto item's text says which profile auto picked
+        self.syntax_combo = combo = QComboBox()
+        combo.addItem('auto: %s' % self.syntax_profile.name, 'auto')
+        for name in self.SYNTAX_PROFILES:
+            combo.addItem(name, name)
+        combo.setToolTip("syntax highlighting language")
+        combo.currentIndexChanged.connect(lambda index: self.set_syntax_profile(combo.itemData(index)))
+        self.format_toolbar.addWidget(combo)
+
 
         act = QAction("➤", self)
         act.setToolTip("run script in blender")
@@ -155,13 +1211,28 @@ class MegasolidCodeEditor( MegasolidEditor ):
         act.triggered.connect( self.run_script )
         self.format_toolbar.addAction(act)
 
+        act = QAction("⚙", self)
+        act.setToolTip("run script in background blender")
+        act.setStatusTip("run script in background blender")
+        act.triggered.connect( self.run_script_in_worker )
+        self.format_toolbar.addAction(act)
 
-        if sys.platform=='win32' and not os.path.isdir('/tmp'):
-            os.mkdir('/tmp')
+        act = QAction("■", self)
+        act.setToolTip("cancel running blender jobs")
+        act.setStatusTip("cancel running blender jobs")
+        act.triggered.connect( self.blender_jobs.cancel_all )
+        self.format_toolbar.addAction(act)
+        self.blender_jobs.changed.connect(self.on_blender_jobs_changed)
+        QApplication.instance().aboutToQuit.connect(self.blender_worker.stop)
+        QApplication.instance().aboutToQuit.connect(self.scratch.cleanup)
+        QApplication.instance().aboutToQuit.connect(self.blend_cache.flush)
 
 
     def toggle_syntax_highlight(self, val, btn):
         self.use_syntax_highlight = val
+        self.highlighter.set_enabled(val)
+        if self.loading_highlighter is not None:
+            self.loading_highlighter.set_enabled(val)
         if val:
             btn.setText('🗹')
         else:
@@ -207,38 +1278,134 @@ class MegasolidCodeEditor( MegasolidEditor ):
     ZIG_KEYWORDS = 'defer null undefined try pub comptime var or callconv export'.split()
     for _ in ZIG_KEYWORDS + ZIG_TYPES: SYNTAX_ZIG[_]='orange'
 
-    SYNTAX = {}
-    SYNTAX.update(SYNTAX_PY)
-    SYNTAX.update(SYNTAX_C)
-    SYNTAX.update(SYNTAX_C3)
-    SYNTAX.update(SYNTAX_ZIG)
+    SYNTAX_CONTROL = {}
+    for _ in 'if else for while return'.split(): SYNTAX_CONTROL[_]='red'
+
+    SYNTAX = merge_syntax(SYNTAX_PY, SYNTAX_C, SYNTAX_C3, SYNTAX_ZIG)
+
+    ## the first profile whose sniff regex matches the top of an untitled document wins,
+    ## `any` is the fallback that colors every known keyword
+    SYNTAX_PROFILES = {}
+    for _ in (
+        SyntaxProfile('zig', ['.zig', '.zon'],
+            merge_syntax(SYNTAX_CONTROL, {'const':'yellow', 'struct':'yellow'}, SYNTAX_ZIG),
+            sniff=r'@import\(|^pub fn '),
+        SyntaxProfile('c3', ['.c3', '.c3i', '.c3t'],
+            merge_syntax(SYNTAX_CONTROL, SYNTAX_C, SYNTAX_C3),
+            sniff=r'^module \w+|^import std|^fn '),
+        SyntaxProfile('c', ['.c', '.h'],
+            merge_syntax(SYNTAX_CONTROL, SYNTAX_C),
+            sniff=r'^#include|^#define'),
+        SyntaxProfile('python', ['.py', '.pyw'],
+            SYNTAX_PY,
+            sniff=r'^(def|class) \w+.*:|^import \w+$|^from [\w.]+ import'),
+        SyntaxProfile('any', [], SYNTAX),
+    ): SYNTAX_PROFILES[_.name]=_
+    SNIFF_CHARS = 4096
+
+    def get_syntax_profile(self, path=None, txt=None):
+        if path:
+            ext = splitext(path)
+            for profile in self.SYNTAX_PROFILES.values():
+                if ext in profile.extensions:
+                    return profile
+        if txt:
+            for profile in self.SYNTAX_PROFILES.values():
+                if profile.sniff(txt):
+                    return profile
+        return self.SYNTAX_PROFILES['any']
+
+    def set_syntax_profile(self, name):
+        self.auto_syntax = name == 'auto'
+        if self.auto_syntax:
+            profile = self.get_syntax_profile(self.path, self.get_sniff_text())
+        else:
+            profile = self.SYNTAX_PROFILES[name]
+        self.activate_syntax_profile(profile)
+
+    def activate_syntax_profile(self, profile):
+        if self.auto_syntax:
+            combo = self.syntax_combo
+            combo.blockSignals(True)
+            combo.setItemText(combo.findData('auto'), 'auto: %s' % profile.name)
+            combo.blockSignals(False)
+        if profile is self.syntax_profile:
+            return
+        self.syntax_profile = profile.compile(self.OBJ_SYMS)
+        self.status.showMessage('syntax: %s' % profile.name)
+        self.highlighter.rehighlight()
+        if self.loading_highlighter is not None:
+            self.loading_highlighter.rehighlight()
+
+    def get_sniff_text(self):
+        o = []
+        size = 0
+        block = self.editor.document().firstBlock()
+        while block.isValid() and size < self.SNIFF_CHARS:
+            o.append(block.text())
+            size += block.length()
+            block = block.next()
+        return '\n'.join(o)
+
+    def new_highlighter(self, document, on_dirty=None):
+        highlighter = BlockHighlighter(
+            document,
+            self.highlight_block,
+            on_dirty=on_dirty,
+            viewport=self.editor,
+            viewport_blocks=self.VIEWPORT_HIGHLIGHT_BLOCKS
+        )
+        highlighter.set_enabled(self.use_syntax_highlight)
+        return highlighter
+
+    def start_loading(self, loader):
+        ## the streamed in document is not laid out until it is shown, so coloring it
+        ## costs no relayout: it gets a highlighter of its own while it comes in
+        self.loading_highlighter = self.new_highlighter(loader.document)
+        self.loaded_chars = loader.document.characterCount()
+        super(MegasolidCodeEditor,self).start_loading(loader)
+
+    def stop_loading(self):
+        super(MegasolidCodeEditor,self).stop_loading()
+        if self.loading_highlighter is not None:
+            self.loading_highlighter.set_document(None)
+            self.loading_highlighter = None
+
+    def on_load_progress(self, done, total):
+        super(MegasolidCodeEditor,self).on_load_progress(done, total)
+        ## Qt only tells a highlighter of edits to a document that is laid out
+        size = self.loading_highlighter.doc.characterCount()
+        self.loading_highlighter.mark_dirty(self.loaded_chars - 1, size)
+        self.loaded_chars = size
+
+    def set_document(self, document):
+        ## a streamed in file arrives as a new document, see TextFileLoader
+        self.editor.document().blockCountChanged.disconnect(self.update_line_counts)
+        if self.loading_highlighter is not None and self.loading_highlighter.doc is document:
+            ## what came in since the last slice is still to color
+            self.loading_highlighter.mark_dirty(self.loaded_chars - 1, document.characterCount())
+            self.loading_highlighter.on_dirty = self.on_dirty_blocks
+            self.highlighter.set_document(None)
+            self.highlighter, self.loading_highlighter = self.loading_highlighter, None
+            super(MegasolidCodeEditor,self).set_document(document)
+        else:
+            super(MegasolidCodeEditor,self).set_document(document)
+            self.highlighter.set_document(document)
+        document.blockCountChanged.connect(self.update_line_counts)
+        self.update_line_counts()
+
+    def set_text(self, text, plain=False):
+        ## the profile is picked before the text goes in, so Qt colors it once, as part of that edit
+        if self.auto_syntax:
+            self.activate_syntax_profile(self.get_syntax_profile(self.path, text[:self.SNIFF_CHARS]))
+        super(MegasolidCodeEditor,self).set_text(text, plain)
 
     def has_keywords(self, txt):
-        tokens = txt.split()
-        for kw in self.SYNTAX:
-            if kw in tokens:
-                return True
-        return False
+        return self.syntax_profile.syntax_re.search(txt) is not None
 
-    def tokenize(self, txt):
-        toks = []
-        for c in txt:
-            #if c==self.OBJ_REP or c==self.OBJ_TABLE or c==self.OBJ_BLEND:
-            if c==self.OBJ_REP or c==self.OBJ_TABLE or c in self.BLEND_SYMS:
-                toks.append(c)
-            elif c in (' ', '\t'):
-                if not toks or type(toks[-1]) is not list:
-                    toks.append([])
-                toks[-1].append(c)
-            elif c == '\n':
-                toks.append(b'\n')
-            elif c in '()[]{}:.-=+*&^%<>/|':
-                toks.append(tuple([c]))
-            else:
-                if not toks or type(toks[-1]) is not str:
-                    toks.append('')
-                toks[-1] += c
-        return toks
+    def tokenize(self, txt, pos=0):
+        for m in self.syntax_profile.token_re.finditer(txt, pos):
+            yield Token(m.lastgroup, m.group(), m.start())
 
     ## https://qthub.com/static/doc/qt5/qtgui/qtextdocument.html#toPlainText
     ## Note: Embedded objects, such as images, are represented by a Unicode value U+FFFC (OBJECT REPLACEMENT CHARACTER).
@@ -246,174 +1413,283 @@ class MegasolidCodeEditor( MegasolidEditor ):
     OBJ_TABLE = '▦' #'\x00'
     #OBJ_BLEND = '🮵'  ## no font on MS Windows for this :(
     BLEND_SYMS = 'ก ข ฃ ค ฅ ฆ ง จ ฉ ช ฌ ญ ฎ ฐ ฑ ฒ ณ ต ถ ธ ฤ ป ผ ฝ ฟ ภ ย ล ฦ ว ศ ษ ส ห ฬ อ ฮ ฯ'.split()
-    def loop(self):
-        if not self.use_syntax_highlight:
-            return
-        h = self.editor.toHtml()
-        if h != self.prev_html:
-            if '\x00' in h:
-                ## this can happen on copy and paste from libreoffice a null byte at the end
-                h = h.replace('\x00', '')
-
-            try:
-                d = xml.dom.minidom.parseString(h)
-            except xml.parsers.expat.ExpatError as err:
-                for i,ln in enumerate(h.splitlines()):
-                   print(i+1,ln.encode('utf-8'))
-                raise err
-
-            #tables = [elt for elt in d.getElementsByTagName('table')]
-            #if tables:
-            #    self.tables = tables
-            images = [img.getAttribute('src') for img in d.getElementsByTagName('img')]
-
-            txt = self.editor.toPlainText()
-            print('-'*80)
-            print(txt.encode('utf-8'))
-            print('_'*80)
-            toks = self.tokenize(txt)
-            print(toks)
-
-            cur = self.editor.textCursor()
-            pos = cur.position()
-            doc = xml.dom.minidom.Document()
-            p = doc.createElement('p')
-            p.setAttribute('style', 'margin-top:12px; margin-bottom:12px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px; white-space: pre-wrap;')
-            img_index = 0
-            tab_index = 0
-            blend_index = 0
-            nodes = []
-            skip_imgs = []
-            for tok in toks:
-                if tok==self.OBJ_TABLE:
-                    tab = self.tables[tab_index]
-                    print(tab)
-                    print(tab.toxml())
-                    anchor = doc.createElement('a')
-                    anchor.setAttribute('href', str(tab_index))
-                    anchor.setAttribute('style', 'color:cyan')
-                    anchor.appendChild(doc.createTextNode(self.OBJ_TABLE))
-                    nodes.append(anchor)
-                    tab_index += 1
-                elif tok in self.BLEND_SYMS:
-                    info = self.blends[blend_index]
-                    anchor = doc.createElement('a')
-                    anchor.setAttribute('href', 'BLENDER:%s' % blend_index)
-                    anchor.setAttribute('style', 'color:cyan; font-size:32px;')
-                    anchor.appendChild(doc.createTextNode(tok))
-                    if tok in self.blend_thumbs:
-                        img = doc.createElement('img')
-                        img.setAttribute('src', self.blend_thumbs[tok])
-                        img.setAttribute('width','32')
-                        img.setAttribute('height','32')
-                        skip_imgs.append(self.blend_thumbs[tok])
-                        anchor.appendChild(img)
-                    nodes.append(anchor)
-                    blend_index += 1
-                elif tok==self.OBJ_REP:
-                    src = images[ img_index ]
-                    if src in skip_imgs:
-                        img_index += 1
-                        continue
-                    img = doc.createElement('img')
-                    if not src.startswith('/tmp'):
-                        q = QImage(src)
-                        a,b = os.path.split(src)
-                        tmp = '/tmp/%s.png'%b
-                        if tmp not in self.qimages:
-                            qlab = QLabel()
-                            qs = q.scaled(256,256, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                            qpix = QPixmap.fromImage(qs)
-                            qlab.setPixmap(qpix)
-                            self.images_layout.addWidget(qlab)
-                            self.qimages[tmp]=qpix
-
-                        qs = q.scaled(32,32, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                        qs.save(tmp)
-                        src = tmp
-
-                    img_index += 1
-                    img.setAttribute('src', src)
-                    anchor = doc.createElement('a')
-                    anchor.setAttribute('href', src)
-                    anchor.appendChild(img)
-                    nodes.append(anchor)
-                elif type(tok) is bytes:
-                    assert tok==b'\n'
-                    nodes.append( doc.createElement('br') )
-                elif type(tok) is str:
-                    if tok in self.SYNTAX:
-                        f = doc.createElement('font')
-                        f.setAttribute('color', self.SYNTAX[tok])
-                        f.appendChild(doc.createTextNode(tok))
-                        nodes.append(f)
-                    else:
-                        nodes.append(doc.createTextNode(tok))
-                elif type(tok) in (list,tuple):
-                    nodes.append(doc.createTextNode(''.join(tok)))
-
-            for elt in nodes:
-                p.appendChild(elt)
-
-            html = p.toxml()
-            html = html.replace('<br />', '<br/>')
-            o = []
-            lines = []
-            for idx, ln in enumerate(html.split('<br/>')):
-                if '{' in ln and ln.count('{')==ln.count('}'):
-                    ln = ln.replace('{', '{<u style="background-color:blue">')
-                    ln = ln.replace('}', '</u>}')
-                o.append(ln)
-                lines.append(str(idx+1))
-            self.line_counts.setText( "<p style='line-height: 1.1;'>%s</p>" % '<br/>'.join(lines))
-            html = '<br/>'.join(o)
-
-            html = html.replace('[', '[<b style="background-color:purple">')
-            html = html.replace(']', '</b>]')
-
-            html = html.replace('(', '<i style="background-color:black">(')
-            html = html.replace(')', ')</i>')
-
-            self.editor.setHtml(html)
-            self.prev_html = self.editor.toHtml()
-            cur = self.editor.textCursor()
+    BLEND_SYM_SET = frozenset(BLEND_SYMS)
+    OBJ_SYMS = frozenset([OBJ_REP, OBJ_TABLE] + BLEND_SYMS)
+
+    def highlight_block(self, txt, state):
+        if state < 0:
+            state = 0
+        parens = state & 0xff
+        brackets = (state >> 8) & 0xff
+        balanced = '{' in txt and txt.count('{') == txt.count('}')
+        braces = 0
+        paren_start = bracket_start = brace_start = 0
+        formats = []
+        for kind, tok, pos in self.tokenize(txt):
+            if kind == 'keyword':
+                formats.append((pos, len(tok), self.syntax_format(self.syntax_profile.syntax[tok])))
+            elif kind == 'object':
+                if tok == self.OBJ_TABLE:
+                    formats.append((pos, 1, self.syntax_format('cyan')))
+            elif kind != 'symbol':
+                continue
+            elif tok == '(':
+                if not parens:
+                    paren_start = pos
+                parens += 1
+            elif tok == ')' and parens:
+                parens -= 1
+                if not parens:
+                    formats.append((paren_start, pos+1-paren_start, self.PAREN_FORMAT))
+            elif tok == '[':
+                if not brackets:
+                    bracket_start = pos + 1
+                brackets += 1
+            elif tok == ']' and brackets:
+                brackets -= 1
+                if not brackets:
+                    formats.append((bracket_start, pos-bracket_start, self.BRACKET_FORMAT))
+            elif balanced and tok == '{':
+                if not braces:
+                    brace_start = pos + 1
+                braces += 1
+            elif balanced and tok == '}' and braces:
+                braces -= 1
+                if not braces:
+                    formats.append((brace_start, pos-brace_start, self.BRACE_FORMAT))
+
+        pos = len(txt)
+        ## open parens and brackets continue on the next block
+        if parens:
+            formats.append((paren_start, pos-paren_start, self.PAREN_FORMAT))
+        if brackets:
+            formats.append((bracket_start, pos-bracket_start, self.BRACKET_FORMAT))
+        return formats, min(parens, 0xff) | (min(brackets, 0xff) << 8)
+
+    def syntax_format(self, color):
+        if color not in self.syntax_formats:
+            fmt = QTextCharFormat()
+            fmt.setForeground(QColor(color))
+            self.syntax_formats[color] = fmt
+        return self.syntax_formats[color]
+
+    syntax_formats = {}
+    PAREN_FORMAT = QTextCharFormat()
+    PAREN_FORMAT.setFontItalic(True)
+    PAREN_FORMAT.setBackground(QColor('black'))
+    BRACKET_FORMAT = QTextCharFormat()
+    BRACKET_FORMAT.setFontWeight(QFont.Weight.Bold)
+    BRACKET_FORMAT.setBackground(QColor('purple'))
+    BRACE_FORMAT = QTextCharFormat()
+    BRACE_FORMAT.setFontUnderline(True)
+    BRACE_FORMAT.setBackground(QColor('blue'))
+
+    def update_line_counts(self, *args):
+        ## past MAX_LINE_COUNTS the label would outgrow what a widget can be, and take seconds
+        count = self.editor.document().blockCount()
+        lines = [str(i+1) for i in range(min(count, self.MAX_LINE_COUNTS))]
+        if count > self.MAX_LINE_COUNTS:
+            lines.append('… %s' % count)
+        self.line_counts.setText( "<p style='line-height: 1.1;'>%s</p>" % '<br/>'.join(lines))
+
+    def on_dirty_blocks(self, start, end):
+        if self.auto_syntax and self.syntax_profile.name == 'any' and start < self.SNIFF_CHARS:
+            profile = self.get_syntax_profile(txt=self.get_sniff_text())
+            if profile is not self.syntax_profile:
+                self.activate_syntax_profile(profile)
+        if self.images_range is not None:
+            start = min(start, self.images_range[0])
+            end = max(end, self.images_range[1])
+        self.images_range = (start, end)
+        self.images_timer.start(0)
+        if self.tooltips:
+            self.tooltip_timer.start(self.TOOLTIP_PRUNE_DELAY)
+
+    def on_images_timer(self):
+        start, end = self.images_range
+        self.images_range = None
+        self.update_images(start, end)
+
+    def is_inline_image(self, src):
+        return src.startswith(self.INLINE_IMAGE) or src in self.blend_thumbs.values()
+
+    def add_inline_image(self, src, position=None):
+        ## a file and its file: URL share one cache entry and one thumbnail
+        src = image_path(src)
+        thumb = self.image_cache.peek(src, self.INLINE_THUMB_SIZE)
+        preview = self.image_cache.peek(src, self.INLINE_PREVIEW_SIZE)
+        if thumb is None or preview is None:
+            ## decoded and scaled off the GUI thread, a placeholder stands in until on_image_ready
+            self.editor.load_image(src)
+            if position is not None:
+                self.editor.image_at(src, position)
+        return self.set_inline_image(src, thumb, preview)
+
+    def set_inline_image(self, src, thumb, preview):
+        name = self.INLINE_IMAGE + src
+        if preview is not None and name not in self.qimages:
+            qlab = QLabel()
+            qpix = QPixmap.fromImage(preview)
+            qlab.setPixmap(qpix)
+            self.images_layout.addWidget(qlab)
+            self.qimages[name]=qpix
+        if thumb is None:
+            thumb = placeholder_image(self.INLINE_THUMB_SIZE)
+        self.editor.document().addResource(QTextDocument.ResourceType.ImageResource, QUrl(name), thumb)
+        return name
+
+    def on_image_ready(self, src, image, scaled):
+        src = image_path(src)
+        self.image_cache.add(src, scaled)
+        self.set_inline_image(src, scaled[self.INLINE_THUMB_SIZE], scaled[self.INLINE_PREVIEW_SIZE])
+
+    def update_images(self, start, end):
+        ## dropped images are swapped in place for a 32px thumbnail that links to the preview,
+        ## the thumbnail is only a document resource named after the original
+        document = self.editor.document()
+        images = []
+        block = document.findBlock(start)
+        while block.isValid() and block.position() <= end:
+            it = block.begin()
+            while not it.atEnd():
+                frag = it.fragment()
+                fmt = frag.charFormat()
+                if fmt.isImageFormat():
+                    name = fmt.toImageFormat().name()
+                    if not self.is_inline_image(name):
+                        images.append((frag.position(), name))
+                    elif name.startswith(self.INLINE_IMAGE) and name not in self.qimages:
+                        ## a reopened document, its thumbnails are made again from the originals
+                        self.add_inline_image(name[len(self.INLINE_IMAGE):], frag.position())
+                it += 1
+            block = block.next()
+
+        for pos, src in images:
+            name = self.add_inline_image(src, pos)
+            img = QTextImageFormat()
+            img.setName(name)
+            img.setAnchor(True)
+            img.setAnchorHref(name)
+            cur = QTextCursor(document)
             cur.setPosition(pos)
-            self.editor.setTextCursor(cur)
+            cur.setPosition(pos+1, QTextCursor.MoveMode.KeepAnchor)
+            cur.insertImage(img)
 
     def get_blend_symbol(self, url):
         if url not in self.blend_syms:
             self.blend_syms[url] = self.blender_symbols.pop()
         return self.blend_syms[url]
 
-    def on_new_blend(self, url, document=None, cursor=None):
+    def on_new_blend(self, url, document=None, cursor=None, preview=False):
         print('got blender file:', url)
         #cursor.insertHtml('<a href="BLENDER:%s" style="color:blue">%s</a>' % (len(self.blends), self.OBJ_BLEND))
         sym = self.get_blend_symbol(url)
         if cursor is None:
             cursor = self.editor.textCursor()
 
-        cursor.insertHtml('<a href="BLENDER:%s" style="color:blue">%s</a>' % (len(self.blends), sym))
+        index = len(self.blends)
+        cursor.insertHtml('<a href="BLENDER:%s" style="color:cyan; font-size:32px;">%s</a>' % (index, sym))
 
-        info = self.parse_blend(url)
-        info['URL'] = url
-        info['SYMBOL'] = sym
+        ## the symbol goes in right away, the metadata fills in when blender is done with it
+        info = {'URL':url, 'SYMBOL':sym, 'objects':{}, 'selected':[], 'PENDING':True}
         self.blends.append(info)
         self.blend_files[url] = info
-        if 'THUMB' in info and info['THUMB']:
-            self.blend_thumbs[sym] = info['THUMB']
-            q = QImage(info['THUMB'])
-            qpix = QPixmap.fromImage(q) #.scaled(64,64, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            self.blend_previews[url] = qpix
-
+        ## the thumbnail goes right after the symbol, even if the user keeps typing there
+        thumb_cursor = QTextCursor(cursor)
+        thumb_cursor.setKeepPositionOnInsert(True)
+        self.show_blend(info)
+        self.parse_blend(url,
+            lambda result: self.on_blend_parsed(info, index, result, thumb_cursor, preview),
+            lambda err: self.on_blend_failed(info, err),
+            lambda part: self.on_blend_part(info, part)
+        )
+
+    def on_blend_parsed(self, info, index, result, cursor, preview=False):
+        info.update(result)
+        info.pop('PENDING', None)
+        self.tooltips.pop('BLENDER:%s' % index, None)
+        sym = info['SYMBOL']
+        url = info['URL']
+        q = self.get_blend_thumb(info)
+        if q is not None:
+            ## the thumbnail is a document resource, it never goes through a file
+            name = 'blend-thumb:%s' % sym
+            self.blend_thumbs[sym] = name
+            self.editor.document().addResource(QTextDocument.ResourceType.ImageResource, QUrl(name), q)
+            self.blend_previews[url] = QPixmap.fromImage(q)
+            cursor.insertHtml('<a href="BLENDER:%s"><img src="%s" width="32" height="32"/></a>' % (index, name))
+        if preview and url not in self.blend_previews:
+            self.render_preview(info)
+        if self.is_showing_blend(info):
+            self.show_blend(info)
+
+    def on_blend_part(self, info, part):
+        merge_dump(info, part)
+        ## a big scene comes in many parts, the side panel is rebuilt at most every BLEND_PANEL_INTERVAL
+        if self.is_showing_blend(info) and time.time() - self.side_blend_time > self.BLEND_PANEL_INTERVAL:
+            self.show_blend(info)
+
+    def get_blend_thumb(self, info):
+        url = info['URL']
+        if url not in self.blend_images and info.get('THUMB'):
+            ## a cache hit, the raw rgba is read back as is
+            width, height = info['THUMB_SIZE']
+            try:
+                self.blend_images[url] = thumb_to_qimage(open(info['THUMB'], 'rb').read(), width, height)
+            except OSError:
+                return None
+        return self.blend_images.get(url)
+
+    def export_blend_thumb(self, info):
+        q = self.get_blend_thumb(info)
+        if q is None:
+            return
+        name = os.path.splitext(os.path.basename(info['URL']))[0] + '.png'
+        path, _ = QFileDialog.getSaveFileName(self, "Export thumbnail", name, "PNG images (*.png)")
+        if path and not q.save(path):
+            self.dialog_critical('could not write %s' % path)
+
+    def on_blend_failed(self, info, err):
+        print('failed to parse blend:', info['URL'], err)
+        info.pop('PENDING', None)
+        info['ERROR'] = err
+        if self.is_showing_blend(info):
+            self.show_blend(info)
+
+    def show_blend(self, info):
         clear_layout(self.images_layout)
-        self.images_layout.addWidget(self.blend_to_qt(info))
+        widget = self.blend_to_qt(info)
+        self.images_layout.addWidget(widget)
+        self.side_blend = (info, widget)
+        self.side_blend_time = time.time()
+        ## asked for once the widget is up: render_preview shows the blend again when
+        ## the preview is there, right away for one embedded in the blend
+        url = info['URL']
+        if url not in self.blend_previews and not info.get('PENDING') and 'ERROR' not in info:
+            self.render_preview(info)
+
+    def is_showing_blend(self, info):
+        ## anything else shown in the side panel is swapped in with clear_layout, which unparents this widget
+        return self.side_blend is not None and self.side_blend[0] is info and self.side_blend[1].parent() is not None
+
+    def on_blender_jobs_changed(self):
+        jobs = self.blender_jobs
+        if jobs.running or jobs.queue:
+            self.status.showMessage('blender: %s running, %s queued' % (len(jobs.running), len(jobs.queue)))
+        else:
+            self.status.clearMessage()
 
     def get_blend_from_symbol(self, sym):
         for info in self.blends:
             if info['SYMBOL'] == sym:
                 return info
 
-    def run_script(self, *args):
+    def get_script(self):
+        '''
+        the editor text as a blender python script, with the blend symbols
+        replaced by their selected objects; returns the script and the blends
+        it uses, the first being the one blender should open
+        '''
         txt = self.editor.toPlainText()
         header = [
             'import bpy',
@@ -421,7 +1697,7 @@ class MegasolidCodeEditor( MegasolidEditor ):
         py = []
         blends = []
         for c in txt:  ## note: not using .splitlines because it removes OBJ_REP?
-            if c in self.BLEND_SYMS:
+            if c in self.BLEND_SYM_SET:
                 info = self.get_blend_from_symbol(c)
                 sel = info['selected']
                 blends.append(info)
@@ -470,19 +1746,31 @@ class MegasolidCodeEditor( MegasolidEditor ):
                 continue
             py.append(c)
         py = '\n'.join(header) + '\n' + ''.join(py)
+        return py, blends
+
+    def run_script(self, *args):
+        py, blends = self.get_script()
         print(py)
         self.show_script(py)
-        if sys.platform=='win32':
-            tmp='C:\\tmp\\__user__.py'
-        else:
-            tmp='/tmp/__user__.py'
+        ## blender reads it after it starts, so it stays until the scratch space goes
+        tmp = self.scratch.path('.py', 'script')
         open(tmp,'wb').write(py.encode('utf-8'))
         cmd = [BLENDER]
         if blends:
             cmd.append(blends[0]['URL'] )
         cmd += ['--window-geometry','640','100', '800','800', '--python-exit-code','1', '--python', tmp ]
-        print(cmd)
-        subprocess.check_call(cmd)
+        job = BlenderJob(cmd, queued=False)
+        job.failed.connect(lambda job, err: self.status.showMessage('script: %s' % err))
+        self.blender_jobs.submit(job)
+
+    def run_script_in_worker(self, *args):
+        py, blends = self.get_script()
+        self.show_script(py)
+        blend = blends[0]['URL'] if blends else None
+        job = WorkerJob(self.blender_worker, 'exec', queued=False, blend=blend, script=py)
+        job.finished.connect(lambda job: self.show_script(py + '\n\n' + (job.result or '')))
+        job.failed.connect(lambda job, err: self.status.showMessage('script: %s' % err))
+        self.blender_jobs.submit(job)
 
     def show_script(self, txt):
         clear_layout(self.images_layout)
@@ -494,7 +1782,7 @@ class MegasolidCodeEditor( MegasolidEditor ):
     def open_blend(self, url):
         cmd = [BLENDER, url]
         print(cmd)
-        subprocess.check_call(cmd)
+        QProcess.startDetached(cmd[0], cmd[1:])
 
     def blend_to_qt(self, dump):
         layout = QVBoxLayout()
@@ -512,17 +1800,28 @@ class MegasolidCodeEditor( MegasolidEditor ):
         btn.clicked.connect(lambda : self.open_blend(url))
         layout.addWidget(btn)
 
-        if url not in self.blend_previews:
-            cmd = [BLENDER, url, '--background', '--python', __file__, '--', '--render=/tmp/__blend__.png']
-            print(cmd)
-            subprocess.check_call(cmd)
-            q = QImage('/tmp/__blend__.png')
-            qpix = QPixmap.fromImage(q)
-            self.blend_previews[url]=qpix
+        if dump.get('PENDING'):
+            layout.addWidget(QLabel('reading blend...'))
+            if url in self.blend_jobs:
+                btn = QPushButton('cancel')
+                btn.clicked.connect(lambda : self.blender_jobs.cancel(self.blend_jobs[url]))
+                layout.addWidget(btn)
+        elif 'ERROR' in dump:
+            layout.addWidget(QLabel(dump['ERROR']))
 
         qlab = QLabel()
-        qlab.setPixmap(self.blend_previews[url])
+        if url in self.blend_previews:
+            if self.blend_previews[url].isNull():
+                qlab.setText('no preview')
+            else:
+                qlab.setPixmap(self.blend_previews[url])
+        elif not dump.get('PENDING') and 'ERROR' not in dump:
+            qlab.setText('rendering preview...')
         layout.addWidget(qlab)
+        if self.get_blend_thumb(dump) is not None:
+            btn = QPushButton('export thumbnail')
+            btn.clicked.connect(lambda : self.export_blend_thumb(dump))
+            layout.addWidget(btn)
 
 
         layout.addStretch(1)
@@ -540,6 +1839,9 @@ class MegasolidCodeEditor( MegasolidEditor ):
         return container
 
     def toggle_blend_object(self, toggle, name, info):
+        for index, b in enumerate(self.blends):
+            if b is info:
+                self.tooltips.pop('BLENDER:%s' % index, None)
         if toggle:
             if name not in info['selected']:
                 info['selected'].append(name)
@@ -547,23 +1849,74 @@ class MegasolidCodeEditor( MegasolidEditor ):
             if name in info['selected']:
                 info['selected'].remove(name)
 
-    def parse_blend(self, blend):
-        cmd = [BLENDER, blend, '--background', '--python', __file__, '--', '--dump-blend=/tmp/__blend__.json']
-        print(cmd)
-        subprocess.check_call(cmd)
-        info = json.loads(open('/tmp/__blend__.json').read())
-        print(info)
+    def render_preview(self, info):
+        url = info['URL']
+        if url in self.preview_jobs:
+            return
+        q = self.get_blend_thumb(info)
+        if q is not None:
+            self.blend_previews[url] = QPixmap.fromImage(q)
+            if self.is_showing_blend(info):
+                self.show_blend(info)
+            return
+        job = self.preview_jobs[url] = WorkerJob(self.blender_worker, 'render', blend=url, out='.png',
+            size=self.PREVIEW_SIZE, samples=self.PREVIEW_SAMPLES, engine=self.PREVIEW_ENGINE)
+        job.started.connect(lambda job: QTimer.singleShot(int(self.PREVIEW_BUDGET*1000), lambda: self.on_preview_timeout(url, job)))
+        job.finished.connect(lambda job: self.on_preview_rendered(info, job.out))
+        job.failed.connect(lambda job, err: self.on_preview_rendered(info, None))
+        self.blender_jobs.submit(job)
+
+    def on_preview_timeout(self, url, job):
+        if self.preview_jobs.get(url) is job:
+            print('preview render over budget:', url)
+            ## the worker may have other jobs waiting, it is not killed for this one
+            job.abandon()
+
+    def on_preview_rendered(self, info, path):
+        url = info['URL']
+        self.preview_jobs.pop(url, None)
+        ## a failed, cancelled or too slow render keeps the placeholder instead of retrying
+        q = QImage(path) if path else QImage()
+        self.scratch.release(path)
+        self.blend_previews[url] = QPixmap.fromImage(q)
+        if self.is_showing_blend(info):
+            self.show_blend(info)
+
+    def parse_blend(self, blend, on_parsed, on_failed, on_part=None):
+        info = self.blend_cache.get(blend)
+        if info is not None:
+            on_parsed(info)
+            return
+
+        ## most blends can be read without blender, it is only started for the rest,
+        ## including any the reader fails on (blender has the final say on errors)
+        try:
+            info = nailer.blend_read_metadata(blend)
+        except Exception as err:
+            print('blend reader failed, asking blender:', blend, err)
+            info = None
+        if info is not None:
+            self.on_blend_dumped(blend, info, on_parsed)
+            return
 
+        ## the dump streams in as parts, each one merged as soon as it is read
+        dump = {}
+        job = self.blend_jobs[blend] = WorkerJob(self.blender_worker, 'dump', blend=blend)
+        job.progress.connect(lambda job, part: (merge_dump(dump, part), on_part and on_part(part)))
+        job.finished.connect(lambda job: self.on_blend_dumped(blend, dump, on_parsed))
+        job.failed.connect(lambda job, err: (self.blend_jobs.pop(blend, None), on_failed(err)))
+        self.blender_jobs.submit(job)
+
+    def on_blend_dumped(self, blend, info, on_parsed):
+        self.blend_jobs.pop(blend, None)
+        thumb = None
         buf,x,y = nailer.blend_extract_thumb(blend)
         if buf:
-            png = nailer.write_png(buf,x,y)
-            a,b = os.path.split(blend)
-            tmp = '/tmp/%s.thumb.png' % b
-            open(tmp,'wb').write(png)
-            info['THUMB']=tmp
-            print(tmp)
+            thumb = (buf,x,y)
+            self.blend_images[blend] = thumb_to_qimage(buf,x,y)
 
-        return info
+        self.blend_cache.put(blend, info, thumb)
+        on_parsed(info)
 
     def on_link_clicked(self, url):
         print('clicked:', url)
@@ -576,9 +1929,7 @@ class MegasolidCodeEditor( MegasolidEditor ):
             tab.show()
         elif url.startswith("BLENDER:"):
             info = self.blends[ int(url.split(':')[-1] ) ]
-            url = info['URL']
-            clear_layout(self.images_layout)
-            self.images_layout.addWidget(self.blend_to_qt(info))
+            self.show_blend(info)
 
         elif url in self.qimages:
             qlab = QLabel()
@@ -587,58 +1938,66 @@ class MegasolidCodeEditor( MegasolidEditor ):
             self.images_layout.addWidget(qlab)
             qlab.show()
 
-    def table_to_qt(self, elt):
-        tab = QTableWidget()
+    def table_to_qt(self, table):
+        tab = QTableView()
         tab.setStyleSheet('background-color:white; color:black;')
-        rows = elt.getElementsByTagName('tr')
-        tab.setRowCount(len(rows))
-        tab.setColumnCount( len(rows[0].getElementsByTagName('td')) )
-        for y, tr in enumerate( elt.getElementsByTagName('tr') ):
-            for x, td in enumerate( tr.getElementsByTagName('td') ):
-                txt = get_dom_text(td.childNodes).strip()
-                print(x,y, txt)
-                tab.setItem(y,x, QTableWidgetItem(txt))
-
+        tab.setModel(TableModel(table, tab))
         tab.resizeColumnsToContents()
         return tab
 
-    def on_new_table(self, elt):
-        tab = self.table_to_qt(elt)
+    def on_new_table(self, rows):
+        self.tooltips.pop(str(len(self.tables)), None)
+        table = Table.from_rows(rows)
+        tab = self.table_to_qt(table)
         clear_layout(self.images_layout)
         self.images_layout.addStretch(1)
         self.images_layout.addWidget(tab)
-        return elt
+        return table
 
     def on_mouse_over_anchor(self, event, url, sym):
-        if sym==self.OBJ_TABLE:
+        ## tooltips are cached by anchor href until their table or blend selection changes
+        if url in self.tooltips:
+            tip = self.tooltips[url]
+        elif sym==self.OBJ_TABLE:
             assert url.isdigit()
             tab = self.tables[int(url)]
-            arr = self.table_to_code(tab)
-            print(arr)
-            QToolTip.showText(event.globalPosition().toPoint(), arr)
-        elif sym in self.BLEND_SYMS:
+            tip = self.tooltips[url] = self.table_to_code(tab)
+        elif sym in self.BLEND_SYM_SET:
             info = self.blends[ int(url.split(':')[-1]) ]
             tip = info['URL'] + '\nselected:\n'
             if len(info['selected']):
                 for name in info['selected']:
                     tip += '\t'+name + '\n'
             else:
-                tip = ' (no objects selected)'
-            QToolTip.showText(event.globalPosition().toPoint(), tip)
+                tip += ' (no objects selected)'
+            self.tooltips[url] = tip
+        else:
+            return
+        QToolTip.showText(event.globalPosition().toPoint(), tip)
 
-    def table_to_code(self, elt):
+    def prune_tooltips(self):
+        ## a table tooltip is the whole table as code, it goes when the table's link is deleted
+        if not any(url.isdigit() for url in self.tooltips):
+            return
+        document = self.editor.document()
+        linked = set()
+        cursor = document.find(self.OBJ_TABLE)
+        while not cursor.isNull():
+            linked.add(cursor.charFormat().anchorHref())
+            cursor = document.find(self.OBJ_TABLE, cursor)
+        for url in [url for url in self.tooltips if url.isdigit() and url not in linked]:
+            del self.tooltips[url]
+
+    def table_to_code(self, table):
         o = []
-        rows = elt.getElementsByTagName('tr')
-        if len(rows)==1:
-            tr = rows[0]
-            for x, td in enumerate( tr.getElementsByTagName('td') ):
-                txt = get_dom_text(td.childNodes).strip()
-                o.append(txt)
+        if table.rows==1:
+            for x in range(table.cols):
+                o.append(table.cell(0,x))
         else:
-            for y, tr in enumerate( rows ):
+            for y in range(table.rows):
                 r = []
-                for x, td in enumerate( tr.getElementsByTagName('td') ):
-                    txt = get_dom_text(td.childNodes).strip()
+                for x in range(table.cols):
+                    txt = table.cell(y,x)
                     if not txt:
                         r.append('0')
                     else:
@@ -648,14 +2007,72 @@ class MegasolidCodeEditor( MegasolidEditor ):
         return '{%s}' % ','.join(o)
 
 
-def get_dom_text(nodelist):
-    rc = []
-    for node in nodelist:
-        if node.nodeType == node.TEXT_NODE:
-            rc.append(node.data)
+class Table(object):
+    '''
+    pasted table converted once into columns: a column of whole numbers is
+    stored as array('q'), a column of floats (empty cells as nan) as
+    array('d'), anything else as a list of interned strings
+    '''
+    __slots__ = ('rows', 'cols', 'columns')
+
+    def __init__(self, rows, cols, columns):
+        self.rows = rows
+        self.cols = cols
+        self.columns = columns
+
+    @staticmethod
+    def from_rows(rows):
+        ## ragged rows (a short first row, or cells missing on the right) are padded with ''
+        cols = max((len(r) for r in rows), default=0)
+        columns = []
+        for x in range(cols):
+            columns.append(pack_column([r[x] if x < len(r) else '' for r in rows]))
+        return Table(len(rows), cols, columns)
+
+    def cell(self, y, x):
+        col = self.columns[x]
+        v = col[y]
+        if type(col) is list:
+            return v
+        elif col.typecode == 'q':
+            return str(v)
+        elif v != v:  ## nan
+            return ''
         else:
-            rc.append(get_dom_text(node.childNodes))
-    return ''.join(rc)
+            return repr(v)
+
+def pack_column(cells):
+    ## only take a typed array when every cell converts back to exactly the same text
+    try:
+        col = array('q', [int(c) for c in cells])
+        if all(str(v)==c for v,c in zip(col, cells)):
+            return col
+    except (ValueError, OverflowError):
+        pass
+    try:
+        col = array('d', [float(c) if c else float('nan') for c in cells])
+        if all(repr(v)==c and v==v for v,c in zip(col, cells) if c):
+            return col
+    except ValueError:
+        pass
+    return [sys.intern(c) for c in cells]
+
+
+class TableModel(QAbstractTableModel):
+    def __init__(self, table, parent=None):
+        super(TableModel, self).__init__(parent)
+        self.table = table
+
+    def rowCount(self, parent=None):
+        return self.table.rows
+
+    def columnCount(self, parent=None):
+        return self.table.cols
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.table.cell(index.row(), index.column())
+
 
 def clear_layout(layout):
     for i in reversed(range(layout.count())):
@@ -665,17 +2082,31 @@ def clear_layout(layout):
 if __name__ == "__main__":
     print('num args:', len(sys.argv))
     print(sys.argv)
+    if '--blend-cache-stats' in sys.argv:
+        print(json.dumps(BlendCache().stats(), indent=2))
+        sys.exit()
+    if '--fake-blender' in sys.argv:
+        BLENDER_WORKER = [sys.executable, __file__, '--fake-worker']
     app = QApplication(sys.argv)
     app.setApplicationName("Megasolid Idiom")
     window = MegasolidCodeEditor()
     window.reset()
     user_vars = list(string.ascii_letters)
     user_vars.reverse()
+    args = []
     for arg in sys.argv[1:]:
+        if arg == '--fake-blender':
+            continue
+        if os.path.isdir(arg):
+            args += sorted(os.path.join(arg, name) for name in os.listdir(arg) if name.endswith('.blend'))
+        else:
+            args.append(arg)
+    ## every blend is dumped and previewed on the worker pool, symbols go in before any of them is done
+    for arg in args:
         if arg.endswith('.blend'):
             cur = window.editor.textCursor()
             cur.insertText('%s = ' % user_vars.pop())
-            window.on_new_blend(arg)
+            window.on_new_blend(arg, preview=True)
             cur.insertText('\n')
         else:
             cur.insertText(arg + '\n')
@@ -0,0 +1,207 @@
+import gzip, io, os, struct, zlib
+
+import blender_thumbnailer as nailer
+
+def read_png(png):
+    ## (width, height, rows) of an 8 bit RGBA png, checking every chunk crc
+    assert png[:8] == b'\x89PNG\r\n\x1a\n'
+    pos = 8
+    chunks = []
+    while pos < len(png):
+        size, = struct.unpack('!I', png[pos:pos+4])
+        tag = png[pos+4:pos+8]
+        data = png[pos+8:pos+8+size]
+        crc, = struct.unpack('!I', png[pos+8+size:pos+12+size])
+        assert crc == zlib.crc32(tag + data)
+        chunks.append((tag, data))
+        pos += 12 + size
+    assert chunks[0][0] == b'IHDR' and chunks[-1] == (b'IEND', b'')
+    width, height, depth, color, _, _, _ = struct.unpack('!2I5B', chunks[0][1])
+    assert (depth, color) == (8, 6)
+    raw = zlib.decompress(b''.join(data for tag, data in chunks if tag == b'IDAT'))
+    line = width * 4 + 1
+    assert len(raw) == line * height
+    rows = [raw[y*line:(y+1)*line] for y in range(height)]
+    assert all(row[0] == 0 for row in rows)
+    return width, height, [row[1:] for row in rows]
+
+def rgba(width, height):
+    ## row y is filled with the byte y, so the flip is easy to see
+    return b''.join(bytes([y]) * width * 4 for y in range(height))
+
+def test_write_png_flips_rows():
+    width, height, rows = read_png(nailer.write_png(rgba(3, 5), 3, 5))
+    assert (width, height) == (3, 5)
+    assert rows == [bytes([y]) * 12 for y in reversed(range(5))]
+
+def test_iter_png_splits_idat():
+    buf = bytes(range(256)) * 1024
+    chunks = list(nailer.iter_png(buf, 256, 256, level=0, idat_size=1024))
+    assert len([c for c in chunks if c[4:8] == b'IDAT']) > 1
+    assert read_png(b''.join(chunks))[2][0] == buf[-1024:]
+
+def test_write_png_settings_and_file():
+    buf = rgba(16, 16)
+    expected = read_png(nailer.write_png(buf, 16, 16))
+    assert read_png(nailer.write_png(buf, 16, 16, level=1, strategy=zlib.Z_RLE)) == expected
+    out = io.BytesIO()
+    assert nailer.write_png(buf, 16, 16, out=out) is None
+    assert read_png(out.getvalue()) == expected
+
+def make_blend(blocks, head=b'BLENDER-v402'):
+    ## a blend file made of (code, data) blocks, in the layout the header asks for
+    if head.startswith(b'BLENDER17'):
+        bhead = struct.Struct('>4siQqq' if head[12:13] == b'V' else '<4siQqq')
+        pack = lambda code, data: bhead.pack(code, 0, 0, len(data), 1)
+    else:
+        order = '>' if head[8:9] == b'V' else '<'
+        bhead = struct.Struct(order + ('4siQii' if head[7:8] == b'-' else '4siIii'))
+        pack = lambda code, data: bhead.pack(code, len(data), 0, 0, 1)
+    o = [head]
+    for code, data in blocks + [(b'ENDB', b'')]:
+        o += [pack(code, data), data]
+    return b''.join(o)
+
+THUMB = (b'\x01\x02\x03\xff' * 2) + (b'\x04\x05\x06\xff' * 2)
+
+def thumb_block(order='<'):
+    return (b'TEST', struct.pack(order + 'ii', 2, 2) + THUMB)
+
+def write(tmp_path, data, name='x.blend'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def test_blend_blocks_layouts(tmp_path):
+    blocks = [(b'REND', b'r' * 8), (b'GLOB', b'g' * 5), (b'DATA', b'')]
+    for head in (b'BLENDER-v402', b'BLENDER_V279', b'BLENDER-V300', b'BLENDER17-01v0500'):
+        path = write(tmp_path, make_blend(blocks, head))
+        with nailer.BlendBlocks(path) as bb:
+            assert bb.version in (402, 279, 300, 500)
+            found = [(code, bytes(bb.read(offset, length))) for code, offset, length in bb]
+        assert found == blocks + [(b'ENDB', b'')], head
+
+def test_blend_blocks_gzip_streams(tmp_path):
+    data = make_blend([(b'REND', b'r' * 8), thumb_block()])
+    path = write(tmp_path, gzip.compress(data))
+    with nailer.BlendBlocks(path) as bb:
+        assert bb.map is None and bb.version == 402
+        codes = []
+        for code, offset, length in bb:
+            codes.append(code)
+            if code == b'TEST':
+                assert bytes(bb.read(offset, length))[8:] == THUMB
+        assert codes == [b'REND', b'TEST', b'ENDB']
+
+def test_blend_blocks_not_a_blend(tmp_path):
+    for data in (b'', b'not a blend at all'):
+        with nailer.BlendBlocks(write(tmp_path, data)) as bb:
+            assert bb.version == 0
+            assert list(bb) == []
+
+def test_blend_blocks_truncated(tmp_path):
+    data = make_blend([(b'REND', b'r' * 8), (b'GLOB', b'g' * 64)])
+    path = write(tmp_path, data[:-40])
+    with nailer.BlendBlocks(path) as bb:
+        assert [code for code, offset, length in bb] == [b'REND', b'GLOB']
+
+def test_blend_extract_thumb(tmp_path):
+    path = write(tmp_path, make_blend([(b'REND', b'r' * 8), thumb_block(), (b'GLOB', b'g')]))
+    assert nailer.blend_extract_thumb(path) == (THUMB, 2, 2)
+    path = write(tmp_path, make_blend([thumb_block('>')], b'BLENDER_V279'))
+    assert nailer.blend_extract_thumb(path) == (THUMB, 2, 2)
+    ## no thumbnail right after the render info, or one of the wrong size
+    path = write(tmp_path, make_blend([(b'REND', b'r'), (b'GLOB', b'g'), thumb_block()]))
+    assert nailer.blend_extract_thumb(path) == (None, 0, 0)
+    path = write(tmp_path, make_blend([(b'TEST', struct.pack('<ii', 3, 2) + THUMB)]))
+    assert nailer.blend_extract_thumb(path) == (None, 0, 0)
+
+def make_sdna(types, structs, endian='<'):
+    ## DNA1 block data: types are (name, size), structs (type, [(field type, field name)])
+    def strings(tag, items):
+        data = b''.join(i.encode('latin-1') + b'\0' for i in items)
+        data += b'\0' * (-len(data) % 4)
+        return tag + struct.pack(endian + 'i', len(items)) + data
+    names = []
+    for name, fields in structs:
+        for ftype, fname in fields:
+            if fname not in names:
+                names.append(fname)
+    type_names = [name for name, size in types]
+    tlen = struct.pack(endian + '%dH' % len(types), *[size for name, size in types])
+    tlen += b'\0' * (-len(tlen) % 4)
+    strc = struct.pack(endian + 'i', len(structs))
+    for name, fields in structs:
+        strc += struct.pack(endian + 'HH', type_names.index(name), len(fields))
+        for ftype, fname in fields:
+            strc += struct.pack(endian + 'HH', type_names.index(ftype), names.index(fname))
+    return b'SDNA' + strings(b'NAME', names) + strings(b'TYPE', type_names) + b'TLEN' + tlen + b'STRC' + strc
+
+TYPES = [('char', 1), ('int', 4), ('float', 4), ('ID', 80), ('Material', 96), ('Link', 16)]
+STRUCTS = [
+    ('ID', [('char', '*next'), ('char', 'name[66]'), ('char', 'pad[6]')]),
+    ('Material', [('ID', 'id'), ('float', 'r'), ('float', 'g'), ('float', 'b'), ('float', 'a')]),
+    ('Link', [('Link', '*next'), ('int', '(*func)()')]),
+]
+
+def test_sdna_layouts():
+    for endian in '<>':
+        sdna = nailer.SDNA(b'pad.' + make_sdna(TYPES, STRUCTS, endian), 4, 8, endian)
+        assert sdna.index == ['ID', 'Material', 'Link']
+        size, fields = sdna.structs['ID']
+        assert size == 80
+        assert fields == {'next': (0, 'char', True, 1), 'name': (8, 'char', False, 66), 'pad': (74, 'char', False, 6)}
+        assert sdna.structs['Material'][1]['r'] == (80, 'float', False, 1)
+        assert sdna.structs['Material'][1]['a'] == (92, 'float', False, 1)
+        assert sdna.structs['Link'][1]['func'] == (8, 'int', True, 1)
+    ## 32 bit pointers
+    sdna = nailer.SDNA(make_sdna(TYPES, STRUCTS), 0, 4, '<')
+    assert sdna.structs['ID'][1]['name'][0] == 4
+
+def test_sdna_rejects_garbage():
+    data = make_sdna(TYPES, STRUCTS)
+    for bad in (b'XXXX' + data[4:], data[:4] + b'XXXX' + data[8:]):
+        try:
+            nailer.SDNA(bad, 0, 8, '<')
+        except ValueError:
+            pass
+        else:
+            assert False, 'no ValueError'
+
+def test_blend_data_fields(tmp_path):
+    name = b'MARed'.ljust(66, b'\0') + b'\0' * 6
+    material = struct.pack('<Q', 0) + name + struct.pack('<4f', 1, 0.5, 0, 1)
+    blocks = [(b'MA\0\0', material), (b'DNA1', make_sdna(TYPES, STRUCTS))]
+    path = write(tmp_path, make_blend(blocks))
+    with nailer.BlendBlocks(path, whole=True) as bb:
+        data = nailer.BlendData(bb)
+        (offset, address), = data.ids(b'MA')
+        assert data.get(offset, 'Material', 'id.name') == 'MARed'
+        assert [data.get(offset, 'Material', c) for c in 'rgba'] == [1, 0.5, 0, 1]
+        assert data.get(offset, 'Material', 'id.next') == 0
+        assert data.field('Material', 'id.name') == (8, 'char', False, 66)
+        del data
+    assert nailer.blend_read_metadata(path) is None
+
+def test_blend_read_metadata_not_a_blend(tmp_path):
+    assert nailer.blend_read_metadata(write(tmp_path, b'nope')) is None
+    assert nailer.blend_read_metadata(write(tmp_path, make_blend([(b'REND', b'r')]))) is None
+
+def test_find_blends(tmp_path, monkeypatch):
+    for name in ('a/x.blend', 'a/notes.txt', 'b/x.blend', 'b/c/y.blend', 'take[1].blend'):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+    monkeypatch.chdir(tmp_path)
+    join = os.path.join
+    ## directories are searched recursively, named relative to the directory
+    assert list(nailer.find_blends(['b'])) == [(join('b', 'x.blend'), 'x.blend'), (join('b', 'c', 'y.blend'), join('c', 'y.blend'))]
+    ## a file and a glob are named alike, relative to the part before the first wildcard
+    assert list(nailer.find_blends([join('a', 'x.blend')])) == [(join('a', 'x.blend'), 'x.blend')]
+    assert list(nailer.find_blends([join('a', '*.blend')])) == [(join('a', 'x.blend'), 'x.blend')]
+    assert list(nailer.find_blends([join('*', 'x.blend')])) == [(join('a', 'x.blend'), join('a', 'x.blend')), (join('b', 'x.blend'), join('b', 'x.blend'))]
+    assert list(nailer.find_blends([join('b', '**', '*.blend')])) == [(join('b', 'c', 'y.blend'), join('c', 'y.blend')), (join('b', 'x.blend'), 'x.blend')]
+    ## wildcard characters in the name of a file that exists are taken literally
+    assert list(nailer.find_blends(['take[1].blend'])) == [('take[1].blend', 'take[1].blend')]
+    assert list(nailer.find_blends([str(tmp_path / 'a' / 'x.blend')])) == [(str(tmp_path / 'a' / 'x.blend'), 'x.blend')]
+    assert list(nailer.find_blends(['missing.blend'])) == []
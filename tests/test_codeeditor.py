@@ -0,0 +1,61 @@
+from array import array
+from codeeditor import compile_tokenizer, compile_keywords, Table, pack_column
+
+OBJECTS = ['\ufffc', '▦']
+
+def kinds(regex, txt):
+    return [(m.lastgroup, m.group()) for m in regex.finditer(txt)]
+
+def test_tokenizer_covers_every_character():
+    regex = compile_tokenizer(OBJECTS, ['def'])
+    txt = 'def f(x):\n\treturn x▦\ufffc'
+    assert ''.join(m.group() for m in regex.finditer(txt)) == txt
+    assert kinds(regex, txt) == [
+        ('keyword', 'def'), ('space', ' '), ('word', 'f'), ('symbol', '('), ('word', 'x'),
+        ('symbol', ')'), ('symbol', ':'), ('newline', '\n'), ('space', '\t'), ('word', 'return'),
+        ('space', ' '), ('word', 'x'), ('object', '▦'), ('object', '\ufffc'),
+    ]
+
+def test_tokenizer_keywords_match_whole_words_longest_first():
+    regex = compile_tokenizer(OBJECTS, ['in', 'int', 'import'])
+    assert kinds(regex, 'int inx import') == [
+        ('keyword', 'int'), ('space', ' '), ('word', 'inx'), ('space', ' '), ('keyword', 'import'),
+    ]
+    assert kinds(regex, 'in(x)')[0] == ('keyword', 'in')
+
+def test_tokenizer_without_keywords():
+    regex = compile_tokenizer(OBJECTS, [])
+    assert kinds(regex, 'def x') == [('word', 'def'), ('space', ' '), ('word', 'x')]
+
+def test_keywords_regex():
+    regex = compile_keywords(OBJECTS, ['if'])
+    assert regex.search('x if y')
+    assert regex.search('(if)')
+    assert not regex.search('iff elif')
+    assert not compile_keywords(OBJECTS, []).search('if')
+
+def test_pack_column_types():
+    assert pack_column(['1', '-2', '30']) == array('q', [1, -2, 30])
+    col = pack_column(['1.5', '', '2.0'])
+    assert col.typecode == 'd' and col[0] == 1.5 and col[1] != col[1]
+    ## text that would not come back the same stays text
+    assert pack_column(['01', '2']) == ['01', '2']
+    assert pack_column(['1e3', '2.0']) == ['1e3', '2.0']
+    assert pack_column(['x', '1']) == ['x', '1']
+
+def test_table_from_rows():
+    table = Table.from_rows([['a', '1', '0.5'], ['b', '2', '']])
+    assert (table.rows, table.cols) == (2, 3)
+    assert [[table.cell(y, x) for x in range(3)] for y in range(2)] == [['a', '1', '0.5'], ['b', '2', '']]
+    assert type(table.columns[0]) is list
+    assert table.columns[1].typecode == 'q'
+    assert table.columns[2].typecode == 'd'
+
+def test_table_from_ragged_rows():
+    table = Table.from_rows([['a'], ['b', '2', 'x'], ['c', '3']])
+    assert (table.rows, table.cols) == (3, 3)
+    assert [[table.cell(y, x) for x in range(3)] for y in range(3)] == [['a', '', ''], ['b', '2', 'x'], ['c', '3', '']]
+
+def test_table_from_no_rows():
+    table = Table.from_rows([])
+    assert (table.rows, table.cols, table.columns) == (0, 0, [])
@@ -0,0 +1,147 @@
+import os, stat
+import pytest
+from wordprocessor import scan_tables, write_atomic, saved_images, DocumentSnapshot, TextEdit
+from wordprocessor import QApplication, QTextEdit, QTextCursor, QTextCharFormat, QByteArray, Qt
+try:
+    from PySide6.QtGui import QTextBlockFormat, QTextListFormat
+    from PySide6.QtCore import QMimeData
+except ImportError:
+    from PyQt6.QtGui import QTextBlockFormat, QTextListFormat
+    from PyQt6.QtCore import QMimeData
+
+app = QApplication.instance() or QApplication([])
+
+def test_scan_tables_offsets_and_cells():
+    head = '<p>x &amp; y</p>'
+    table = '<table border="0"><tr><td>a</td><TD align="right">1 &lt; 2</TD></tr><tr><th><b>b</b></th><td></td></tr></table>'
+    html = head + table + '<p>tail</p>'
+    tables = list(scan_tables(html))
+    assert tables == [(len(head), len(head) + len(table), [['a', '1 < 2'], ['b', '']])]
+    start, end, rows = tables[0]
+    assert html[start:end] == table
+
+def test_scan_tables_without_closing_tags():
+    html = '<table><tr><td>a<td>b<tr><td>c'
+    assert list(scan_tables(html)) == [(0, len(html), [['a', 'b'], ['c']])]
+
+def test_scan_tables_nested_table_is_cell_text():
+    html = '<table><tr><td>a<table><tr><td>in</td></tr></table></td><td>b</td></tr></table><table><tr><td>c</td></tr></table>'
+    tables = list(scan_tables(html))
+    assert [rows for start, end, rows in tables] == [[['ain', 'b']], [['c']]]
+
+def test_scan_tables_none():
+    assert list(scan_tables('<p>no tables</p>')) == []
+
+def test_scan_tables_line_breaks():
+    html = '<table><tr><td>one<br>two<BR/>three</td></tr></table>'
+    assert list(scan_tables(html))[0][2] == [['one\ntwo\nthree']]
+
+def test_paste_swaps_tables_for_links():
+    editor = TextEdit()
+    editor.allow_inline_tables = False
+    editor.tables = []
+    source = QMimeData()
+    source.setHtml('<html><head><style>b { color:red }</style></head><body><b>bold <table><tr><td>a</td></tr></table>still bold</b><table><tr><td>b</td></tr></table></body></html>')
+    editor.insertFromMimeData(source)
+    assert editor.tables == [[['a']], [['b']]]
+    assert editor.toPlainText() == 'bold \u25a6still bold\u25a6'
+    cursor = QTextCursor(editor.document())
+    cursor.setPosition(editor.toPlainText().index('still') + 1)
+    assert cursor.charFormat().fontWeight() > 400
+
+def test_write_atomic_text_and_bytes(tmp_path):
+    path = tmp_path / 'doc.txt'
+    write_atomic(str(path), 'caf\u00e9\n' * 10, chunk_size=7)
+    assert path.read_text() == 'caf\u00e9\n' * 10
+    write_atomic(str(path), b'\x89PNG')
+    assert path.read_bytes() == b'\x89PNG'
+    assert os.listdir(tmp_path) == ['doc.txt']
+
+def test_write_atomic_keeps_mode(tmp_path):
+    path = tmp_path / 'doc.txt'
+    path.write_text('old')
+    os.chmod(path, 0o600)
+    write_atomic(str(path), 'new')
+    assert path.read_text() == 'new'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+def test_write_atomic_failure_keeps_old(tmp_path):
+    path = tmp_path / 'doc.txt'
+    path.write_text('old')
+    with pytest.raises(TypeError):
+        write_atomic(str(path), ['not', 'text'])
+    assert path.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['doc.txt']
+
+def test_saved_images_only_img_srcs():
+    images = {'a.png': QByteArray(b'A'), 'b.png': QByteArray(b'B'), 'c&d.png': QByteArray(b'C')}
+    html = '<p>see b.png</p><img src="a.png"/><IMG width="3" src=\'c&amp;d.png\'>'
+    assert saved_images(html, images) == {'a.png': b'A', 'c&d.png': b'C'}
+
+def rich_document():
+    edit = QTextEdit()
+    edit.setHtml('<h1 align="center">title</h1><p>a <b>b</b>\u00a0c</p>')
+    cursor = QTextCursor(edit.document())
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    cursor.insertBlock()
+    cursor.insertList(QTextListFormat.Style.ListDisc)
+    cursor.insertText('one')
+    cursor.insertBlock()
+    cursor.insertText('two')
+    cursor.insertBlock(QTextBlockFormat())
+    cursor.insertTable(2, 2)
+    cursor.insertText('cell')
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    right = QTextBlockFormat()
+    right.setAlignment(Qt.AlignmentFlag.AlignRight)
+    cursor.insertBlock(right)
+    cursor.insertText('right\u2028soft')
+    cursor.insertBlock()
+    cursor.insertImage('image.png')
+    for i in range(20):
+        cursor.insertBlock()
+        italic = QTextCharFormat()
+        italic.setFontItalic(i % 2 == 0)
+        cursor.insertText('line %d \U0001f600' % i, italic)
+        if i % 7 == 0:
+            cursor.insertBlock()
+            cursor.insertTable(1, 2)
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+    return edit
+
+def take(document, html):
+    snapshot = DocumentSnapshot(document, html)
+    snapshot.start()
+    snapshot.finish()
+    return snapshot.text()
+
+@pytest.mark.parametrize('chars', [1, 3, 10, 50, 1 << 20])
+def test_snapshot_matches_whole_document(monkeypatch, chars):
+    # Slices that small cut next to every table, list and empty block there is.
+    monkeypatch.setattr(DocumentSnapshot, 'SLICE_CHARS', chars)
+    monkeypatch.setattr(DocumentSnapshot, 'HTML_SLICE_CHARS', chars)
+    edit = rich_document()
+    document = edit.document()
+    assert take(document, True) == document.toHtml()
+    assert take(document, False) == document.toPlainText()
+
+def test_snapshot_empty_document():
+    edit = QTextEdit()
+    assert take(edit.document(), True) == edit.document().toHtml()
+    assert take(edit.document(), False) == ''
+
+def test_snapshot_starts_over_on_an_edit_to_what_it_took(monkeypatch):
+    monkeypatch.setattr(DocumentSnapshot, 'HTML_SLICE_CHARS', 10)
+    monkeypatch.setattr(DocumentSnapshot, 'BUDGET', 0)
+    edit = QTextEdit()
+    edit.setPlainText('\n'.join('line %d' % i for i in range(20)))
+    document = edit.document()
+    snapshot = DocumentSnapshot(document, True)
+    snapshot.start()
+    snapshot.take_slices()
+    assert 0 < snapshot.position < document.characterCount() - 1
+    cursor = QTextCursor(document)
+    cursor.insertText('edited ')
+    assert snapshot.position == 0
+    snapshot.finish()
+    assert snapshot.text() == document.toHtml()
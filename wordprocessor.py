@@ -12,6 +12,11 @@ if PySide6:
         QAction,
         QActionGroup,
         QTextDocument,
+        QTextCursor,
+        QTextCharFormat,
+        QTextImageFormat,
+        QSyntaxHighlighter,
+        QColor,
         QPixmap,
     )
     from PySide6.QtWidgets import (
@@ -19,6 +24,7 @@ if PySide6:
         QToolTip,
         QTableWidgetItem,
         QTableWidget,
+        QTableView,
         QLabel,
         QTextEdit,
         QMainWindow,
@@ -32,8 +38,9 @@ if PySide6:
         QFontComboBox,
         QComboBox,
         QApplication,
+        QSizePolicy,
     )
-    from PySide6.QtCore import QSize, Qt, QUrl, QTimer
+    from PySide6.QtCore import QSize, Qt, QUrl, QTimer, QObject, QPoint, QAbstractTableModel, QProcess, QRunnable, QThreadPool, QBuffer, QByteArray, QIODevice, Signal
     from PySide6.QtPrintSupport import QPrintDialog
 else:
     from PyQt6.QtGui import (
@@ -44,6 +51,11 @@ else:
         QAction,
         QActionGroup,
         QTextDocument,
+        QTextCursor,
+        QTextCharFormat,
+        QTextImageFormat,
+        QSyntaxHighlighter,
+        QColor,
         QPixmap,
     )
     from PyQt6.QtWidgets import (
@@ -51,6 +63,7 @@ else:
         QToolTip,
         QTableWidgetItem,
         QTableWidget,
+        QTableView,
         QLabel,
         QTextEdit,
         QMainWindow,
@@ -64,11 +77,13 @@ else:
         QFontComboBox,
         QComboBox,
         QApplication,
+        QSizePolicy,
     )
-    from PyQt6.QtCore import QSize, Qt, QUrl, QTimer
+    from PyQt6.QtCore import QSize, Qt, QUrl, QTimer, QObject, QPoint, QAbstractTableModel, QProcess, QRunnable, QThreadPool, QBuffer, QByteArray, QIODevice, pyqtSignal as Signal
     from PyQt6.QtPrintSupport import QPrintDialog
 
-import os, sys, uuid, xml.dom.minidom, subprocess
+import os, sys, uuid, re, subprocess, time
+from html import unescape
 
 FONT_SIZES = [7, 8, 9, 10, 11, 12, 13, 14, 18, 24, 36, 48, 64, 72, 96, 144, 288]
 IMAGE_EXTENSIONS = [".jpg", ".png", ".bmp"]
@@ -83,18 +98,551 @@ def splitext(p):
     return os.path.splitext(p)[1].lower()
 
 
+TABLE_TAG = re.compile(r"<(/?)(table|tr|td|th)\b[^>]*>", re.IGNORECASE)
+MARKUP = re.compile(r"<[^>]*>")
+LINE_BREAK = re.compile(r"<br\b[^>]*>", re.IGNORECASE)
+
+
+def cell_text(html):
+    """Text of a table cell's markup, line breaks kept as newlines."""
+    return unescape(MARKUP.sub("", LINE_BREAK.sub("\n", html))).strip()
+
+
+def scan_tables(html):
+    """
+    Single tolerant pass over clipboard HTML that yields each top level <table> as
+    (start, end, rows), where rows are lists of cell text and start/end are offsets
+    into html, so the markup around the tables can still be inserted in order.
+    Only table, tr, td and th tags are looked at; no DOM is built.
+    """
+    depth = 0
+    start = 0
+    rows = None
+    # Offset where the content of the open cell starts.
+    cell = None
+    for m in TABLE_TAG.finditer(html):
+        closing, tag = m.group(1), m.group(2).lower()
+        if tag == "table":
+            if not closing:
+                depth += 1
+                if depth == 1:
+                    start, rows, cell = m.start(), [], None
+                continue
+            if depth != 1:
+                depth = max(depth - 1, 0)
+                continue
+            depth = 0
+        elif depth != 1:
+            # Nested tables are flattened into the text of the enclosing cell.
+            continue
+
+        if cell is not None:
+            if not rows:
+                rows.append([])
+            rows[-1].append(cell_text(html[cell : m.start()]))
+            cell = None
+
+        if tag == "table":
+            yield start, m.end(), rows
+        elif not closing:
+            if tag == "tr":
+                rows.append([])
+            else:
+                cell = m.end()
+
+    if depth:
+        if cell is not None:
+            if not rows:
+                rows.append([])
+            rows[-1].append(cell_text(html[cell:]))
+        yield start, len(html), rows
+
+
+IMG_SRC = re.compile(r"""<img\b[^>]*?\bsrc\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+
+def encode_png(image):
+    data = QByteArray()
+    buf = QBuffer(data)
+    buf.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buf, "PNG")
+    buf.close()
+    return data
+
+
+class ImageDecodeTask(QRunnable):
+    def __init__(self, decoder, path, image=None, data=None, width=0, ratio=1.0):
+        super(ImageDecodeTask, self).__init__()
+        self.decoder = decoder
+        self.path = path
+        self.image = image
+        self.data = data
+        self.sizes = decoder.sizes
+        self.width = width
+        self.ratio = ratio
+
+    def run(self):
+        # QImage, unlike QPixmap, can be decoded and scaled outside the GUI thread.
+        if self.image is not None:
+            image = self.image
+            # Not on disk, so the original is kept compressed for saving.
+            self.decoder.encoded.emit(self.path, encode_png(image))
+        elif self.data is not None:
+            image = QImage.fromData(self.data)
+        else:
+            image = QImage(self.path)
+        scaled = {}
+        for size in self.sizes:
+            if image.isNull():
+                scaled[size] = QImage()
+            else:
+                scaled[size] = image.scaled(
+                    size, size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation
+                )
+        if self.width and image.width() > self.width:
+            image = image.scaledToWidth(self.width, Qt.TransformationMode.SmoothTransformation)
+            image.setDevicePixelRatio(self.ratio)
+        self.decoder.decoded.emit(self.path, image, scaled)
+
+
+class ImageDecoder(QObject):
+    """
+    Decodes images, and scales them to fit each of sizes, on the global thread pool.
+    decoded(path, image, {size: scaled}) is delivered on the GUI thread; a path is
+    only decoded once while it is pending. A null image means the decode failed.
+    An image wider than the width it is requested at (device pixels, 0 for no
+    limit) comes back scaled down to it, at ratio device pixels per pixel, the
+    scaled copies are made from the original. An image handed over already decoded is also sent back as a PNG
+    by encoded(path, data).
+    """
+
+    decoded = Signal(str, object, object)
+    encoded = Signal(str, object)
+
+    def __init__(self, sizes=()):
+        super(ImageDecoder, self).__init__()
+        self.sizes = tuple(sizes)
+        self.pending = set()
+        self.pool = QThreadPool.globalInstance()
+        self.decoded.connect(self.on_decoded)
+
+    def request(self, path, image=None, data=None, width=0, ratio=1.0):
+        if path not in self.pending:
+            self.pending.add(path)
+            self.pool.start(ImageDecodeTask(self, path, image, data, width, ratio))
+
+    def on_decoded(self, path, image, scaled):
+        self.pending.discard(path)
+
+
+class TextFileLoader(QObject):
+    """
+    Reads a plain text file into a QTextDocument of its own, a slice at a time from
+    the event loop, so a large file does not block the editor while it loads. head,
+    the start of the file, is read right away so it can be shown in the meantime.
+    progress(done, total) is in bytes, finished(document) comes once the whole file
+    is in and failed(error) if reading it fails part way.
+    """
+
+    progress = Signal(int, int)
+    finished = Signal(object)
+    failed = Signal(str)
+
+    CHUNK_SIZE = 1 << 16
+    # Seconds of loading per event loop pass.
+    BUDGET = 0.02
+
+    def __init__(self, path, head_size=1 << 18):
+        super(TextFileLoader, self).__init__()
+        self.file = open(path, "r", errors="replace")
+        self.total = os.fstat(self.file.fileno()).st_size
+        self.head = self.file.read(head_size)
+        # Appending to a document nothing displays skips the layout, which is most
+        # of the cost; the editor lays it out lazily once it is shown.
+        self.document = QTextDocument()
+        self.document.setUndoRedoEnabled(False)
+        self.cursor = QTextCursor(self.document)
+        self.cursor.insertText(self.head)
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.load_slice)
+
+    def start(self):
+        self.timer.start(0)
+
+    def stop(self):
+        self.timer.stop()
+        self.file.close()
+
+    def load_slice(self):
+        deadline = time.time() + self.BUDGET
+        try:
+            while time.time() < deadline:
+                text = self.file.read(self.CHUNK_SIZE)
+                if not text:
+                    self.stop()
+                    self.finished.emit(self.document)
+                    return
+                self.cursor.insertText(text)
+            done = self.file.buffer.tell()
+        except OSError as e:
+            self.stop()
+            self.failed.emit(str(e))
+            return
+        self.progress.emit(done, self.total)
+        self.timer.start(0)
+
+
+def write_atomic(path, data, chunk_size=1 << 20):
+    """
+    Write data (str, encoded as open() would, or bytes) to path through a temporary
+    file next to it that is then renamed over it, so path is only ever the old or
+    the new contents. The text is encoded a chunk at a time rather than all at once.
+    """
+    path = os.path.realpath(path)
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, ".%s.%s.tmp" % (name, hex_uuid()))
+    # Created like open() would, so the umask applies; an existing file keeps its mode.
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with open(fd, "wb" if isinstance(data, bytes) else "w") as f:
+            for i in range(0, len(data), chunk_size):
+                f.write(data[i : i + chunk_size])
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+# What toPlainText() has for the block, line and frame separators and no-break spaces.
+PLAIN_TEXT = (("\u2029", "\n"), ("\u2028", "\n"), ("\ufdd0", "\n"), ("\ufdd1", "\n"), ("\xa0", " "))
+
+
+class DocumentSnapshot(QObject):
+    """
+    Serializes document a slice at a time from the event loop, as toPlainText()
+    or toHtml() would all at once, for a save that does not block the editor. An
+    edit to what is already serialized starts it over. taken(snapshot) comes once
+    it is all in parts, together with the originals of its images (see
+    TextEdit.image_originals) as they were then; text() puts it together.
+    """
+
+    taken = Signal(object)
+
+    # Characters per slice, enough to be worth the cost of a pass and, in HTML,
+    # of a QTextDocumentFragment.
+    SLICE_CHARS = 1 << 18
+    HTML_SLICE_CHARS = 1 << 12
+    # Seconds of serializing per event loop pass.
+    BUDGET = 0.02
+
+    def __init__(self, document, html, images=None):
+        super(DocumentSnapshot, self).__init__()
+        self.document = document
+        self.html = html
+        self.images = images if images is not None else {}
+        # The <html> and <body> of the first HTML slice, they are the same in all.
+        self.head = ""
+        self.parts = []
+        # Where the next slice starts, always at the start of a block.
+        self.position = 0
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.take_slices)
+
+    def start(self):
+        self.document.contentsChange.connect(self.on_contents_change)
+        self.timer.start(0)
+
+    def on_contents_change(self, position, removed, added):
+        # A change to the block at position also changes the separator before it,
+        # which the slice before took along.
+        if position <= self.position:
+            self.parts = []
+            self.position = 0
+
+    def take_slices(self, deadline=None):
+        deadline = deadline or time.time() + self.BUDGET
+        document = self.document
+        end = document.characterCount() - 1
+        cursor = QTextCursor(document)
+        if end == 0:
+            self.parts = [document.toHtml() if self.html else ""]
+        while self.position < end:
+            cursor.setPosition(self.position)
+            stop = self.slice_end(self.position + (self.HTML_SLICE_CHARS if self.html else self.SLICE_CHARS))
+            if self.html:
+                # Its last separator would come out as an empty paragraph of its own.
+                cursor.setPosition(stop - 1 if stop < end else stop, QTextCursor.MoveMode.KeepAnchor)
+                self.parts.append(self.html_body(cursor))
+            else:
+                cursor.setPosition(stop, QTextCursor.MoveMode.KeepAnchor)
+                self.parts.append(cursor.selectedText())
+            self.position = stop
+            if self.position < end and time.time() > deadline:
+                self.timer.start(0)
+                return
+        document.contentsChange.disconnect(self.on_contents_change)
+        self.images = dict(self.images)
+        self.taken.emit(self)
+
+    def slice_end(self, position):
+        """
+        The start of the first block from position on that a slice can end before.
+        Never in a table, a part of one would come out as a table of its own, nor
+        right before or after one, a table at either end of a slice comes out with
+        an empty paragraph next to it, and never before a list item, as the separator
+        before it carries its format.
+        """
+        document = self.document
+        end = document.characterCount() - 1
+        root = document.rootFrame()
+        block = document.findBlock(min(position, end)).next()
+        while block.isValid():
+            frame = document.frameAt(block.position())
+            if frame != root:
+                while frame.parentFrame() != root:
+                    frame = frame.parentFrame()
+                block = document.findBlock(frame.lastPosition() + 1)
+            elif (
+                block.textList() is None
+                and document.frameAt(block.previous().position()) == root
+                and (not block.next().isValid() or document.frameAt(block.next().position()) == root)
+            ):
+                return block.position()
+            block = block.next()
+        return end
+
+    def html_body(self, cursor):
+        """What toHtml() has in <body> for the selection of cursor."""
+        document = self.document
+        part = QTextDocument()
+        part.setUndoRedoEnabled(False)
+        # What toHtml() writes of a document besides its contents.
+        part.setDefaultFont(document.defaultFont())
+        part.setDefaultStyleSheet(document.defaultStyleSheet())
+        part.setDefaultTextOption(document.defaultTextOption())
+        part.setIndentWidth(document.indentWidth())
+        part.rootFrame().setFrameFormat(document.rootFrame().frameFormat())
+        title = QTextDocument.MetaInformation.DocumentTitle
+        part.setMetaInformation(title, document.metaInformation(title))
+        QTextCursor(part).insertFragment(cursor.selection())
+        # A fragment leaves the format of its first block behind.
+        block = document.findBlock(cursor.selectionStart())
+        start = QTextCursor(part)
+        start.setBlockFormat(block.blockFormat())
+        start.setBlockCharFormat(block.charFormat())
+        html = part.toHtml()
+        body = html.index(">", html.index("<body")) + 1
+        if not self.parts:
+            self.head = html[:body]
+        return html[body : html.rindex("</body>")]
+
+    def finish(self):
+        """Serialize what is left now, e.g. before the document is replaced."""
+        self.timer.stop()
+        self.take_slices(deadline=float("inf"))
+
+    def text(self):
+        """The document as toPlainText() or toHtml() had it, once it is taken."""
+        if not self.html:
+            text = "".join(self.parts)
+            for c, replacement in PLAIN_TEXT:
+                text = text.replace(c, replacement)
+            return text
+        if not self.head:
+            return self.parts[0]
+        return self.head + "".join(self.parts) + "</body></html>"
+
+
+def saved_images(html, images):
+    """
+    The originals in images ({name: PNG data}) of the images that html refers to;
+    saved by name next to html the relative links in it work. Only names that are
+    the src of an <img> count, not ones that merely occur in the text.
+    """
+    srcs = set(unescape(src) for src in IMG_SRC.findall(html))
+    return dict((name, data.data()) for name, data in images.items() if name in srcs)
+
+
+class SaveTask(QRunnable):
+    def __init__(self, saver, path, snapshot):
+        super(SaveTask, self).__init__()
+        self.saver = saver
+        self.path = path
+        self.snapshot = snapshot
+
+    def run(self):
+        try:
+            text = self.snapshot.text()
+            write_atomic(self.path, text)
+            if self.snapshot.html:
+                for name, data in saved_images(text, self.snapshot.images).items():
+                    write_atomic(os.path.join(os.path.dirname(self.path), name), data)
+        except Exception as e:
+            self.saver.failed.emit(self.path, str(e))
+        else:
+            self.saver.saved.emit(self.path, len(text))
+
+
+class DocumentSaver(QObject):
+    """
+    Saves DocumentSnapshots, one after the other so a later save always wins: each
+    is taken from the event loop, then put together and written with write_atomic
+    on a thread of its own, its images into the same directory, by name.
+    saved(path, length) or failed(path, error) comes back on the GUI thread.
+    """
+
+    saved = Signal(str, int)
+    failed = Signal(str, str)
+
+    def __init__(self):
+        super(DocumentSaver, self).__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        # (path, snapshot) still being taken, the first one is under way.
+        self.queue = []
+
+    def save(self, path, snapshot):
+        snapshot.taken.connect(self.on_taken)
+        self.queue.append((path, snapshot))
+        if len(self.queue) == 1:
+            snapshot.start()
+
+    def on_taken(self, snapshot):
+        path, snapshot = self.queue.pop(0)
+        self.pool.start(SaveTask(self, path, snapshot))
+        if self.queue:
+            self.queue[0][1].start()
+
+    def take(self):
+        """Take the queued snapshots now, before their document is replaced."""
+        while self.queue:
+            self.queue[0][1].finish()
+
+    def wait(self):
+        self.take()
+        self.pool.waitForDone()
+
+
+def image_path(name):
+    """The file an image resource name refers to, the name may be a file: URL."""
+    return QUrl(name).toLocalFile() if name.startswith("file:") else name
+
+
+def placeholder_image(size=32):
+    image = QImage(size, size, QImage.Format.Format_RGB32)
+    image.fill(QColor("gray"))
+    return image
+
+
 class TextEdit(QTextEdit):
+    def __init__(self, *args, **kwargs):
+        super(TextEdit, self).__init__(*args, **kwargs)
+        # (anchor, position) of the last hover callback, so moving within the
+        # same symbol does not recompute its tooltip on every pixel.
+        self.hover = None
+        self.document().contentsChanged.connect(self.reset_hover)
+        # Images decoding in the background, path -> cursors at where they are shown.
+        self.image_decoder = ImageDecoder()
+        self.image_decoder.decoded.connect(self.on_image_decoded)
+        self.image_decoder.encoded.connect(self.on_image_encoded)
+        self.waiting_images = {}
+        # Names whose decoded copy is already a document resource.
+        self.decoded_images = set()
+        # Originals of images that are not files, name -> PNG data.
+        self.image_originals = {}
+
+    def load_image(self, path, image=None):
+        """
+        Put a placeholder in for the image at path and decode it in the background,
+        so inserting it does not wait on the decode. See image_at.
+        An image that was decoded before keeps showing until the new copy is in.
+        The document only gets a copy scaled to fit the viewport; the original stays
+        on disk, or for an image that is not a file (given as image) in image_originals.
+        """
+        if path not in self.waiting_images:
+            self.waiting_images[path] = []
+            if path not in self.decoded_images:
+                self.document().addResource(QTextDocument.ResourceType.ImageResource, QUrl(path), placeholder_image())
+            ratio = self.devicePixelRatioF()
+            if self.isVisible():
+                width = self.viewport().width()
+            else:
+                width = self.screen().availableGeometry().width()
+            width -= 2 * self.document().documentMargin()
+            width = int(width * ratio)
+            if image is not None:
+                self.image_decoder.request(path, image=image, width=width, ratio=ratio)
+            elif path in self.image_originals:
+                self.image_decoder.request(path, data=self.image_originals[path], width=width, ratio=ratio)
+            else:
+                self.image_decoder.request(image_path(path), width=width, ratio=ratio)
+
+    def on_image_encoded(self, path, data):
+        self.image_originals[path] = data
+
+    def original_image(self, name):
+        """The full size image behind the (maybe scaled down) document resource name."""
+        if name in self.image_originals:
+            return QImage.fromData(self.image_originals[name])
+        return QImage(image_path(name))
+
+    def image_at(self, path, position):
+        """
+        Note that the loading image at path is shown at position, only the blocks
+        noted get laid out again when it is decoded, otherwise the whole document does.
+        """
+        if path in self.waiting_images:
+            cursor = QTextCursor(self.document())
+            cursor.setPosition(position)
+            self.waiting_images[path].append(cursor)
+
+    def on_image_decoded(self, path, image, scaled):
+        document = self.document()
+        # The same file may be waited on by its path and by any spelling of its file: URL.
+        for name in [name for name in self.waiting_images if image_path(name) == path]:
+            document.addResource(QTextDocument.ResourceType.ImageResource, QUrl(name), image)
+            self.decoded_images.add(name)
+            if hasattr(self, "on_image_ready"):
+                self.on_image_ready(name, image, scaled)
+            cursors = self.waiting_images.pop(name)
+            if not cursors:
+                document.markContentsDirty(0, document.characterCount())
+            for cursor in cursors:
+                block = document.findBlock(cursor.position())
+                document.markContentsDirty(block.position(), block.length())
+
+    def reset_hover(self):
+        self.hover = None
+
+    def setDocument(self, document):
+        super(TextEdit, self).setDocument(document)
+        document.contentsChanged.connect(self.reset_hover)
+        self.decoded_images = set()
+        self.reset_hover()
+
     def mouseMoveEvent(self, event):
         text_cursor = self.cursorForPosition(event.pos())
         text_position = text_cursor.position()
         self.mouse_over_anchor=self.mouse_over_symbol=None
+        hover = None
         if text_position:
             self.mouse_over_anchor = self.anchorAt(event.pos())
-            txt = self.toPlainText()
-            if text_position < len(txt):
-                self.mouse_over_symbol = self.toPlainText()[text_position]
+            document = self.document()
+            # Read the one character under the mouse rather than copying the whole document.
+            if text_position < document.characterCount() - 1:
+                self.mouse_over_symbol = document.characterAt(text_position)
                 if self.mouse_over_anchor and hasattr(self, 'on_mouse_over_anchor'):
-                    self.on_mouse_over_anchor(event, self.mouse_over_anchor, self.mouse_over_symbol)
+                    hover = (self.mouse_over_anchor, text_position)
+                    if hover != self.hover:
+                        self.on_mouse_over_anchor(event, self.mouse_over_anchor, self.mouse_over_symbol)
+        self.hover = hover
         super(TextEdit,self).mouseMoveEvent(event)
 
     def mousePressEvent(self, e):
@@ -122,35 +670,41 @@ class TextEdit(QTextEdit):
         document = self.document()
         if source.hasHtml():
             html = source.html()
-            print(html.encode('utf-8'))
             if html.endswith('\x00'):
                 html = html[:-1]
                 source.setHtml(html)
-            if self.allow_inline_tables:
-                cursor.insertHtml(html)
-            else:
-                doc = xml.dom.minidom.parseString(html)
-                tables = doc.getElementsByTagName('table')
-                if len(tables):
-                    for tab in tables:
-                        cursor.insertHtml('<a href="%s" style="color:blue">▦</a>' % len(self.tables))
-                        if hasattr(self, 'on_new_table'):
-                            self.tables.append(self.on_new_table(tab))
-                        else:
-                            self.tables.append(tab)
-
-                else:
-                    cursor.insertHtml(html)
-
+            # Local images are decoded in the background rather than by the layout.
+            for src in IMG_SRC.findall(html):
+                path = image_path(src)
+                if splitext(path) in IMAGE_EXTENSIONS and os.path.isfile(path):
+                    self.load_image(src)
+            if not self.allow_inline_tables:
+                # Each table is swapped for a link to it and the HTML is inserted whole,
+                # so the head and the tags around the tables still apply.
+                parts = []
+                pos = 0
+                for start, end, rows in scan_tables(html):
+                    parts.append(html[pos:start])
+                    parts.append('<a href="%s" style="color:blue">▦</a>' % len(self.tables))
+                    if hasattr(self, 'on_new_table'):
+                        self.tables.append(self.on_new_table(rows))
+                    else:
+                        self.tables.append(rows)
+                    pos = end
+                if parts:
+                    parts.append(html[pos:])
+                    html = "".join(parts)
+            cursor.insertHtml(html)
             return
 
         elif source.hasUrls():
             for u in source.urls():
                 file_ext = splitext(str(u.toLocalFile()))
                 if u.isLocalFile() and file_ext in IMAGE_EXTENSIONS:
-                    image = QImage(u.toLocalFile())
-                    document.addResource(QTextDocument.ResourceType.ImageResource, u, image)
+                    # A placeholder goes in now and the image once it is decoded.
+                    self.load_image(u.toLocalFile())
                     cursor.insertImage(u.toLocalFile())
+                    self.image_at(u.toLocalFile(), cursor.position() - 1)
                 elif hasattr(self, 'extra_mime_types') and file_ext in self.extra_mime_types:
                     self.extra_mime_types[file_ext]( u.toLocalFile(), document, cursor )
                     return
@@ -164,12 +718,11 @@ class TextEdit(QTextEdit):
                 return
 
         elif source.hasImage():
-            image = source.imageData()
-            uu_id = hex_uuid()
-            document.addResource(
-                QTextDocument.ResourceType.ImageResource, QUrl(uu_id), image
-            )
-            cursor.insertImage(uu_id)
+            # Only a viewport sized copy is kept in the document, see load_image.
+            name = hex_uuid() + ".png"
+            self.load_image(name, source.imageData())
+            cursor.insertImage(name)
+            self.image_at(name, cursor.position() - 1)
             return
 
         super(TextEdit, self).insertFromMimeData(source)
@@ -203,6 +756,15 @@ class MegasolidEditor(QMainWindow):
         # self.path holds the path of the currently open file.
         # If none, we haven't got a file open yet (or creating new).
         self.path = None
+        # The last path the document was opened from or saved to, for when a save fails.
+        self.saved_path = None
+        # The TextFileLoader of a large file still coming in.
+        self.loader = None
+        self.saver = DocumentSaver()
+        self.saver.saved.connect(self.on_saved)
+        self.saver.failed.connect(self.on_save_failed)
+        # Saves still being written are finished before the app goes.
+        QApplication.instance().aboutToQuit.connect(self.saver.wait)
         if self.left_widget:
             layout.addWidget(self.left_widget)
         layout.addWidget(self.editor, stretch=1)
@@ -563,6 +1125,9 @@ class MegasolidEditor(QMainWindow):
         dlg.setIcon(QMessageBox.Icon.Critical)
         dlg.show()
 
+    # Plain text files bigger than this many bytes are streamed in, see TextFileLoader.
+    STREAM_OPEN_SIZE = 8 << 20
+
     def file_open(self):
         path, _ = QFileDialog.getOpenFileName(
             self,
@@ -571,38 +1136,107 @@ class MegasolidEditor(QMainWindow):
             "HTML documents (*.html);Text documents (*.txt);All files (*.*)",
         )
 
+        if not path:
+            return
+
+        self.stop_loading()
+        loader = None
         try:
-            with open(path, "r") as f:
-                text = f.read()
+            if splitext(path) not in HTML_EXTENSIONS and os.path.getsize(path) > self.STREAM_OPEN_SIZE:
+                loader = TextFileLoader(path)
+            else:
+                with open(path, "r") as f:
+                    text = f.read()
 
         except Exception as e:
             self.dialog_critical(str(e))
 
         else:
-            self.path = path
+            self.path = self.saved_path = path
+            if loader:
+                # The top of the file shows (read only) while the rest loads.
+                self.set_text(loader.head, plain=True)
+                self.start_loading(loader)
+            else:
+                self.set_text(text)
+            self.update_title()
+
+    def set_text(self, text, plain=False):
+        # A save still being copied gets the document as it was.
+        self.saver.take()
+        if plain:
+            self.editor.setPlainText(text)
+        else:
             # Qt will automatically try and guess the format as txt/html
             self.editor.setText(text)
-            self.update_title()
+
+    def start_loading(self, loader):
+        self.loader = loader
+        self.editor.setReadOnly(True)
+        loader.progress.connect(self.on_load_progress)
+        loader.finished.connect(self.on_loaded)
+        loader.failed.connect(self.on_load_failed)
+        loader.start()
+
+    def stop_loading(self):
+        if self.loader is not None:
+            self.loader.stop()
+            self.loader = None
+            self.editor.setReadOnly(False)
+
+    def on_load_progress(self, done, total):
+        self.status.showMessage("loading %s: %d%%" % (os.path.basename(self.path), 100 * done // max(total, 1)))
+
+    def on_loaded(self, document):
+        self.loader = None
+        self.set_document(document)
+        self.editor.setReadOnly(False)
+        self.status.showMessage("loaded %s" % os.path.basename(self.path), 3000)
+
+    def on_load_failed(self, error):
+        self.stop_loading()
+        self.dialog_critical(error)
+
+    def set_document(self, document):
+        """
+        Show document in the editor in place of the current one, which the editor
+        deletes. document is taken to start with what is on screen now (a streamed
+        in file does), so the view stays where it is.
+        """
+        self.saver.take()
+        scroll = self.editor.verticalScrollBar().value()
+        viewport = self.editor.viewport()
+        bottom = self.editor.cursorForPosition(QPoint(viewport.width(), viewport.height())).blockNumber()
+        document.setDefaultFont(self.editor.document().defaultFont())
+        document.setParent(self.editor)
+        self.editor.setDocument(document)
+        # The rest of the document is laid out lazily, only what is on screen is needed
+        # before scrolling back to it; the scroll range is told of that much right away
+        # (documentSize() would lay it all out).
+        layout = document.documentLayout()
+        rect = layout.blockBoundingRect(document.findBlockByNumber(bottom))
+        size = rect.size()
+        size.setWidth(document.textWidth())
+        size.setHeight(rect.bottom() + document.documentMargin())
+        layout.documentSizeChanged.emit(size)
+        self.editor.verticalScrollBar().setValue(scroll)
 
     def file_save(self):
+        if self.loader is not None:
+            self.status.showMessage("%s is still loading" % os.path.basename(self.path))
+            return
+
         if self.path is None:
             # If we do not have a path, we need to use Save As.
             return self.file_save_as()
 
-        text = (
-            self.editor.toHtml()
-            if splitext(self.path) in HTML_EXTENSIONS
-            else self.editor.toPlainText()
-        )
-
-        try:
-            with open(self.path, "w") as f:
-                f.write(text)
-
-        except Exception as e:
-            self.dialog_critical(str(e))
+        self.save(self.path)
 
     def file_save_as(self):
+        if self.loader is not None:
+            self.status.showMessage("%s is still loading" % os.path.basename(self.path))
+            return
+
         path, _ = QFileDialog.getSaveFileName(
             self,
             "Save file",
@@ -614,22 +1248,34 @@ class MegasolidEditor(QMainWindow):
             # If dialog is cancelled, will return ''
             return
 
-        text = (
-            self.editor.toHtml()
-            if splitext(path) in HTML_EXTENSIONS
-            else self.editor.toPlainText()
-        )
-
-        try:
-            with open(path, "w") as f:
-                f.write(text)
+        self.save(path)
 
-        except Exception as e:
-            self.dialog_critical(str(e))
-
-        else:
-            self.path = path
+    def save(self, path):
+        # The document is serialized a slice at a time from the event loop, the
+        # encoding and writing happen on the saver's thread.
+        snapshot = DocumentSnapshot(
+            self.editor.document(),
+            splitext(path) in HTML_EXTENSIONS,
+            self.editor.image_originals,
+        )
+        # The document is named after where it goes as soon as the save is
+        # queued, so a later Save writes there too.
+        self.path = path
+        self.update_title()
+        self.status.showMessage("saving %s" % os.path.basename(path))
+        self.saver.save(path, snapshot)
+
+    def on_saved(self, path, length):
+        self.saved_path = path
+        self.status.showMessage("saved %s (%d characters)" % (os.path.basename(path), length), 5000)
+
+    def on_save_failed(self, path, error):
+        self.status.clearMessage()
+        if self.path == path and path != self.saved_path:
+            # Never written there, go back to where the document last was.
+            self.path = self.saved_path
             self.update_title()
+        self.dialog_critical(error)
 
     def file_print(self):
         dlg = QPrintDialog()